@@ -60,6 +60,16 @@ class PyPlotterGeFrame(wx.Frame):
         self.SpinNodeNumber = wx.SpinCtrl(self.panel_1, wx.ID_ANY, "0", min=0, max=0)
         sizer_4.Add(self.SpinNodeNumber, 0, wx.ALIGN_CENTER_VERTICAL | wx.LEFT, 4)
 
+        self.ButtonPlay = wx.ToggleButton(self.panel_1, wx.ID_ANY, "Play")
+        self.ButtonPlay.SetToolTip("Step through all nodes at the selected frame rate. Frames are dropped if drawing can not keep up.")
+        sizer_4.Add(self.ButtonPlay, 0, wx.ALIGN_CENTER_VERTICAL | wx.LEFT, 8)
+
+        label_4 = wx.StaticText(self.panel_1, wx.ID_ANY, "Frame Rate [fps] :  ")
+        sizer_4.Add(label_4, 0, wx.ALIGN_CENTER_VERTICAL | wx.LEFT, 8)
+
+        self.SpinFrameRate = wx.SpinCtrl(self.panel_1, wx.ID_ANY, "10", min=1, max=60)
+        sizer_4.Add(self.SpinFrameRate, 0, wx.ALIGN_CENTER_VERTICAL | wx.LEFT, 4)
+
         self.PanePlots = wx.Panel(self.panel_1, wx.ID_ANY)
         sizer_2.Add(self.PanePlots, 1, wx.EXPAND, 0)
 
@@ -78,10 +88,20 @@ class PyPlotterGeFrame(wx.Frame):
 
         self.Bind(wx.EVT_SPINCTRL, self.on_node_number, self.SpinNodeNumber)
         self.Bind(wx.EVT_TEXT_ENTER, self.on_node_number, self.SpinNodeNumber)
+        self.Bind(wx.EVT_TOGGLEBUTTON, self.on_play, self.ButtonPlay)
+        self.Bind(wx.EVT_SPINCTRL, self.on_frame_rate, self.SpinFrameRate)
         # end wxGlade
 
     def on_node_number(self, event):  # wxGlade: PyPlotterGeFrame.<event_handler>
         print("Event handler 'on_node_number' not implemented!")
         event.Skip()
 
+    def on_play(self, event):  # wxGlade: PyPlotterGeFrame.<event_handler>
+        print("Event handler 'on_play' not implemented!")
+        event.Skip()
+
+    def on_frame_rate(self, event):  # wxGlade: PyPlotterGeFrame.<event_handler>
+        print("Event handler 'on_frame_rate' not implemented!")
+        event.Skip()
+
 # end of class PyPlotterGeFrame
@@ -169,3 +169,46 @@ def save_as(message="Save file", filetype_filter="", default_path="",
     return wx.FileSelector(message, default_path, default_filename, 
                            default_extension, filetype_filter, flags)
 
+
+
+class _TableListCtrl(wx.ListCtrl):
+    """ virtual report list, rows are only formatted when shown """
+
+    def __init__(self, parent, rows, columns):
+        style = wx.LC_REPORT | wx.LC_VIRTUAL | wx.LC_HRULES | wx.LC_VRULES
+        wx.ListCtrl.__init__(self, parent, style=style)
+        self.rows = rows
+        for i, label in enumerate(columns):
+            self.InsertColumn(i, label, width=wx.LIST_AUTOSIZE_USEHEADER)
+        self.SetItemCount(len(rows))
+
+    def OnGetItemText(self, item, col):
+        val = self.rows[item][col]
+        if isinstance(val, float):
+            return "%.6g" % val
+        return str(val)
+
+
+def show_table(rows, columns, title="", parent=None, size=(700, 500)):
+    """Displays a read only table in a modal dialog. 
+
+    The param rows is a list of rows, each a sequence with one value per 
+    entry in columns. Floats are shown with 6 significant digits. The list 
+    is virtual, so tens of thousands of rows open as fast as a few.
+    """
+    if parent is None:
+        parent = wx.GetApp().GetTopWindow()
+    if not title:
+        title = parent.GetTitle() if parent else "Template"
+
+    dialog = wx.Dialog(parent, wx.ID_ANY, title, size=size,
+                       style=wx.DEFAULT_DIALOG_STYLE | wx.RESIZE_BORDER)
+    table = _TableListCtrl(dialog, rows, columns)
+
+    sizer = wx.BoxSizer(wx.VERTICAL)
+    sizer.Add(table, 1, wx.ALL | wx.EXPAND, 5)
+    sizer.Add(dialog.CreateButtonSizer(wx.OK), 0, wx.ALL | wx.ALIGN_RIGHT, 5)
+    dialog.SetSizer(sizer)
+
+    dialog.ShowModal()
+    dialog.Destroy()
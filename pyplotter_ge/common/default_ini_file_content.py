@@ -48,6 +48,9 @@ zero_line_plot_middle = True
 zero_line_plot_bottom = False
 xaxis_show = False
 title_show = False
+readout_all = False
+crosshair = False
+autoy = False
 show_gradx = True
 show_grady = True
 show_gradz = True
@@ -63,6 +66,34 @@ line_color_imaginary = "red"
 line_color_magnitude = "purple"
 line_width = 1.0
 plot_view = "all"
+prefetch_ahead = 4
+prefetch_memory_mb = 64
+prefetch_bitmaps = False
+# async_render draws in a worker thread, off until measured on real nodes
+async_render = False
+# RF energy summary - rf_gate is none, theta or omega to only count RHO
+# where that channel is non-zero, rf_window is in data points (10 s at 1 us)
+rf_gate = "none"
+rf_window = 10000000
+# waveform arrays of least recently viewed nodes are compressed above
+# memory_budget_mb, and dropped when the compressed ones pass memory_cold_mb,
+# memory_compress is zlib (faster) or lzma (smaller), memory_cold_mb = 0 to
+# turn compression off
+memory_budget_mb = 1024
+memory_cold_mb = 256
+memory_compress = "zlib"
+# every memory_keyframes-th node keeps full arrays, the nodes after it are
+# stored as their changed segments against it, 0 to turn this off
+memory_keyframes = 0
+
+# Hardware limits for Tools > Check Gradient Limits, in Plotter file units.
+# The amplitude limit applies to |value|, the slew limit to the value jump
+# between two segments per sample, or per tread for ramps written as runs of
+# steps. These depend on the scanner, so there are no defaults, set both
+# before checking (0 means not set).
+[gradient_limits]
+amplitude = 0
+slew = 0
 
 """
 ,}
@@ -59,6 +59,10 @@ Brian J. Soher, Duke University, September, 2012
 
 # Python modules
 import math
+import time
+import pickle
+import threading
+import collections
 
 # 3rd party modules
 import matplotlib
@@ -75,8 +79,10 @@ if matplotlib.get_backend() != "WXAgg":
 from matplotlib.transforms import blended_transform_factory
 from matplotlib.patches    import Rectangle
 from matplotlib.lines      import Line2D
+from matplotlib.collections import LineCollection
 
 # Our modules
+from pyplotter_ge.common.util_stairs import decimate_stairs, stairs_index, stairs_stats, stairs_vertices, StairsLookup, RangeMinMax, StairsIntegrals
 
 
 DEGREES_TO_RADIANS = math.pi / 180
@@ -87,6 +93,138 @@ DEF_H = np.array([0, 5,  2,  8, 11,  2,  0,  1,  0, 15, 12,  3, 22,  6])
 
 
 
+def lod_arrays(edges, values, axes, resolution=1.0):
+    """
+    Returns the (edges, values) to display for a stairs waveform in an axes.
+    The waveform is decimated to the pixel width of the axes over its current
+    x-range, so drawing cost does not depend on the number of segments. A
+    resolution < 1.0 gives a coarser result, eg. 0.25 is one bin per 4 pixels.
+
+    """
+    xmin, xmax = axes.get_xlim()
+    if xmin > xmax: xmin, xmax = xmax, xmin
+    npix = max(int(axes.bbox.width*resolution), 1)
+    return decimate_stairs(edges, values, npix, xmin, xmax)
+
+
+def render_figure_agg(template, arrays=None, abort=None):
+    """
+    Renders a pickled Figure (see PlotPanelStairs.figure_template()) into an
+    offscreen Agg buffer. Only a private copy of the figure is touched, so
+    this is safe to call from a worker thread.
+
+    If arrays is given, it maps an axes index to an (edges, values) tuple
+    that replaces the stairs data drawn in that axes.
+
+    If abort is given, it is called before the draw starts and the render is
+    skipped, returning None, if it returns True. Agg can not be stopped once
+    drawing, so this is the last point where a stale request is dropped.
+
+    Returns (width, height, rgba_bytes) for use in wx.Bitmap.FromBufferRGBA()
+
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    figure = pickle.loads(template)
+    canvas = FigureCanvasAgg(figure)
+
+    if arrays:
+        for axes in figure.axes:
+            for patch in axes.patches:
+                gid = patch.get_gid()
+                if gid and gid.startswith('stairs') and int(gid[6:]) in arrays:
+                    e, v = arrays[int(gid[6:])]
+                    e, v = lod_arrays(e, v, axes)
+                    patch.set_data(v, e)
+
+    if abort is not None and abort():
+        return None
+
+    canvas.draw()
+    width, height = canvas.get_width_height()
+    return width, height, bytes(canvas.buffer_rgba())
+
+
+
+class AsyncRenderer(object):
+    """
+    Runs render_figure_agg() in a worker thread so the GUI thread never waits
+    on Agg. Only the newest request matters: submitting a new template
+    replaces any request still waiting, a request that went stale while its
+    figure was unpickled is not drawn, and results of requests older than
+    the latest submit() or cancel() are thrown away.
+
+    The callback is called from the worker thread as callback(generation,
+    result), where result is the (width, height, rgba_bytes) tuple. The
+    receiver should compare generation against self.generation once it is
+    back on the GUI thread, since a newer request may have come in since.
+
+    """
+
+    def __init__(self, callback):
+
+        self.callback = callback
+        self.generation = 0
+
+        self._job = None
+        self._stopped = False
+        self._cond = threading.Condition()
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+
+    def submit(self, template, arrays=None):
+        """
+        queue a pickled figure, and the stairs data to draw in it, for
+        rendering, returns its generation
+
+        """
+        with self._cond:
+            self.generation += 1
+            self._job = (self.generation, template, arrays)
+            self._cond.notify()
+            return self.generation
+
+    def cancel(self):
+        """ forget the waiting request and any render still in progress """
+        with self._cond:
+            self.generation += 1
+            self._job = None
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+
+    def _run(self):
+
+        while True:
+            with self._cond:
+                while self._job is None and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                generation, template, arrays = self._job
+                self._job = None
+
+            try:
+                result = render_figure_agg(template, arrays, abort=lambda: generation != self.generation)
+            except Exception:
+                # the caller still has canvas.draw() to fall back on
+                continue
+            if result is None:
+                continue
+
+            with self._cond:
+                if generation != self.generation:
+                    continue
+            self.callback(generation, result)
+
+
+
+
 
 class PlotPanelStairs(wx.Panel):
     """
@@ -98,7 +236,9 @@ class PlotPanelStairs(wx.Panel):
     need an axes to attach to to init properly.
 
     on_size events simply set a flag, and the actual resizing of the figure is
-    triggered by an Idle event.
+    triggered by an Idle event. While sizing is in progress, the stairs are
+    drawn at a coarse resolution. A single full resolution draw is done once
+    the size has settled.
 
     PlotPanel Functionality
     --------------------------------------------------
@@ -130,6 +270,15 @@ class PlotPanelStairs(wx.Panel):
     # during events.
     _EVENT_DEBUG = False
 
+    # Minimum time in msec between on_motion() calls, about one frame
+    _MOTION_INTERVAL = 16
+
+    # While the user drags the window size around, stairs are drawn at
+    # 1/_RESIZE_COARSE of screen resolution. A full resolution draw is done
+    # once the size has not changed for _RESIZE_SETTLE msec.
+    _RESIZE_COARSE = 4
+    _RESIZE_SETTLE = 250
+
     def __init__(self, parent, naxes=2,
                                color=None,
                                dpi=None,
@@ -228,6 +377,39 @@ class PlotPanelStairs(wx.Panel):
         self.all_axes = list(self.axes)
         self.show_flags = [True for item in range(naxes)]
 
+        # stairs artists are redrawn at screen resolution whenever the x-range
+        # changes, see lod_arrays()
+        self._stairs = [None for item in range(naxes)]
+        self._template = None
+        self._template_key = None
+        for axes in self.all_axes:
+            axes.callbacks.connect('xlim_changed', self._on_xlim_changed)
+
+        # optional multi-node overlay, one LineCollection per axes
+        self._overlay = [None for item in range(naxes)]
+        self._overlay_count = 0
+
+        # optional plain line per axes on top of the stairs, see set_curves()
+        self._curves = [None for item in range(naxes)]
+
+        # auto-y mode fits each ylim to the data inside the x-range whenever
+        # the x-range changes, using a RangeMinMax query per channel
+        self.autoy = False
+        self._range_minmax = [None for item in range(naxes)]
+
+        # prefix sums for area/mean/rms between the reference cursors
+        self._integrals = [None for item in range(naxes)]
+
+        # saved axes layouts, see display_naxes() and format_axes()
+        self._layouts = {}
+        self._layout_key = None
+        self._format_key = None
+
+        # zoom history, see push_view()
+        self._history = []
+        self._history_pos = -1
+        self._drawn_limits = None
+
         # plot format setup
         if not prefs:
             prefs = fake_prefs()
@@ -257,8 +439,31 @@ class PlotPanelStairs(wx.Panel):
         self.refs = []
         self.middle = []
 
+        # draw_async() renders in a worker thread and swaps in the bitmap. The
+        # canvas Agg renderer is then out of date, so a real draw is done on
+        # the next button press before any widget grabs a blit background.
+        # Connected ahead of the widgets so it runs before their handlers.
+        self._agg_stale = False
+        self._async = AsyncRenderer(self._on_async_result)
+        self.canvas.mpl_connect('button_press_event', self._on_async_press)
+        self.canvas.mpl_connect('draw_event', self._on_async_draw)
+
+        # unlinked widgets share one set of canvas callbacks and one blit
+        # background, see EventDispatcher
+        self.events = EventDispatcher(self.canvas) if unlink else None
+
         self.set_color( color )
         self._resizeflag = False
+        self._resizing = False
+        self._resize_start = None
+        self._anim_background = None
+
+        # duration in seconds of recent resize renders, as (kind, time) where
+        # kind is 'coarse' during a drag and 'full' once the size settled
+        self.resize_render_times = collections.deque(maxlen=100)
+        self._resize_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self._on_resize_settled, self._resize_timer)
+        self.canvas.mpl_connect('draw_event', self._on_resize_draw)
 
         self.Bind(wx.EVT_IDLE, self._on_idle)
         self.Bind(wx.EVT_SIZE, self._on_size)
@@ -288,7 +493,8 @@ class PlotPanelStairs(wx.Panel):
                                           useblit=True,
                                           do_zoom_select_event=do_zoom_select_event,
                                           do_zoom_motion_event=do_zoom_motion_event,
-                                          rectprops=props_zoom))
+                                          rectprops=props_zoom,
+                                          dispatcher=self.events))
         if zoom == 'box':
             if not unlink:
                 self.zoom = ZoomBox(  self, self.axes,
@@ -308,7 +514,8 @@ class PlotPanelStairs(wx.Panel):
                                           do_zoom_select_event=do_zoom_select_event,
                                           do_zoom_motion_event=do_zoom_motion_event,
                                           spancoords='data',
-                                          rectprops=props_zoom))
+                                          rectprops=props_zoom,
+                                          dispatcher=self.events))
         if reference:
             if not unlink:
                 self.refs = CursorSpan(self, self.axes,
@@ -322,7 +529,8 @@ class PlotPanelStairs(wx.Panel):
                                           useblit=True,
                                           do_refs_select_event=do_refs_select_event,
                                           do_refs_motion_event=do_refs_motion_event,
-                                          rectprops=props_cursor))
+                                          rectprops=props_cursor,
+                                          dispatcher=self.events))
         if middle:
             if not unlink:
                 self.middle = MiddleEvents(self, self.axes,
@@ -334,15 +542,39 @@ class PlotPanelStairs(wx.Panel):
                     self.middle.append( MiddleEvents(self, [axes],
                                           do_middle_select_event=do_middle_select_event,
                                           do_middle_motion_event=do_middle_motion_event,
-                                          do_middle_press_event=do_middle_press_event))
+                                          do_middle_press_event=do_middle_press_event,
+                                          dispatcher=self.events))
 
+        # motion events are coalesced so on_motion() is called at most once
+        # per display frame, see _on_move()
         self.do_motion_event = True
+        self.readout_all = False
+        self._motion_event = None
+        self._motion_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self._on_motion_timer, self._motion_timer)
         self.motion_id = self.canvas.mpl_connect('motion_notify_event', self._on_move)
 
         self.do_scroll_event = do_scroll_event
         if self.do_scroll_event:
             self.scroll_id = self.canvas.mpl_connect('scroll_event', self._on_scroll)
 
+        # zoom history keeps one entry of axes limits per zoom step. Recent
+        # entries keep the rendered canvas so back/forward can blit it at once
+        self.history_max_bytes = 64*1024*1024
+        self.history_max_steps = 50
+        self.canvas.mpl_connect('draw_event', self._on_history_draw)
+
+        # crosshair mode, one animated vertical line per axes blitted on top
+        # of a background saved at draw time. Connected after the widgets so
+        # their draw_event backgrounds never include the crosshair.
+        self.crosshair = False
+        self.crosshair_props = dict(color='red', linewidth=0.8)
+        self._crosshair_lines = {}
+        self._crosshair_x = None
+        self._crosshair_background = None
+        self.canvas.mpl_connect('draw_event', self._on_crosshair_draw)
+        self.canvas.mpl_connect('figure_leave_event', self._on_crosshair_leave)
+
         # initialize plots with initial data and format axes
         self.set_data(self.data)
         self.update(set_scale=True)
@@ -370,12 +602,12 @@ class PlotPanelStairs(wx.Panel):
         # take min/max only from first data set, since it will always be there
 
         xmin, ymin, xmax, ymax = [], [], [], []
-        for ax in self.all_axes:
-            patch = ax.patches[0].get_data()
-            xmin.append(min(patch.edges))
-            xmax.append(max(patch.edges))
-            ymin.append(min(patch.values))
-            ymax.append(max(patch.values))
+        for ddict in self.data:
+            stats = ddict['stats']
+            xmin.append(stats['xmin'])
+            xmax.append(stats['xmax'])
+            ymin.append(stats['ymin'])
+            ymax.append(stats['ymax'])
 
         xmin = [min(xmin) for item in xmin]
         xmax = [max(xmax) for item in xmax]
@@ -400,6 +632,13 @@ class PlotPanelStairs(wx.Panel):
             axes.set_ylim(y0-ydel,y0+y1+ydel)
 
 
+    def _data_extent(self):
+        """ returns min/max x-values over all data sets from their stats """
+        xmin = min([ddict['stats']['xmin'] for ddict in self.data])
+        xmax = max([ddict['stats']['xmax'] for ddict in self.data])
+        return xmin, xmax
+
+
     def _dprint(self, a_string):
         if self._EVENT_DEBUG:
             print( a_string)
@@ -420,13 +659,37 @@ class PlotPanelStairs(wx.Panel):
         else:
             self._resizeflag = True
 
+        if self._resizeflag:
+            # every size event pushes the full resolution render back
+            self._resizing = True
+            self._resize_timer.StartOnce(self._RESIZE_SETTLE)
+
 
     def _on_idle( self, evt ):
         if self._resizeflag:
             self._resizeflag = False
+            self._resize_start = time.perf_counter()
             self._set_size()
 
 
+    def _on_resize_settled(self, evt):
+        """ size has been stable for a while, render at full resolution """
+        self._resizing = False
+        self.refresh_stairs()
+        self._resize_start = time.perf_counter()
+        self.canvas.draw()
+
+
+    def _on_resize_draw(self, event):
+        """ record how long the render that followed a resize step took """
+        if self._resize_start is not None:
+            elapsed = time.perf_counter() - self._resize_start
+            kind = 'coarse' if self._resizing else 'full'
+            self.resize_render_times.append((kind, elapsed))
+            self._resize_start = None
+            self._dprint('resize render ('+kind+') = %.4f sec' % elapsed)
+
+
     def _set_size( self ):
         pixels = tuple( self.parent.GetClientSize() )
         self.SetSize( pixels )
@@ -434,6 +697,74 @@ class PlotPanelStairs(wx.Panel):
         self.figure.set_size_inches( float( pixels[0] )/self.figure.get_dpi(),
                                      float( pixels[1] )/self.figure.get_dpi() )
         self._current_size = pixels
+        self.clear_history_renders()
+        self.refresh_stairs()
+
+
+    def _on_xlim_changed(self, axes):
+        """ keep the stairs in this axes at screen resolution for new x-range """
+        i = self.all_axes.index(axes)
+        if self._stairs[i] is not None:
+            e, h = self._display_arrays(i, axes)
+            self._stairs[i].set_data(h, e)
+        overlay = self._overlay[i]
+        if overlay is not None and overlay['decimate']:
+            overlay['collection'].set_segments(self._overlay_segments(overlay['arrays'], axes, True))
+        if self.autoy:
+            self._fit_ylim(i, axes)
+
+
+    def _fit_ylim(self, i, axes):
+        """ set ylim of axes to the data range of channel i inside its xlim """
+        ddict = self.data[i]
+        xmin, xmax = sorted(axes.get_xlim())
+        if 'source' in ddict:
+            ymin, ymax = ddict['source'].range_minmax(xmin, xmax)
+        else:
+            if self._range_minmax[i] is None:
+                self._range_minmax[i] = RangeMinMax(ddict['values'][0])
+            ymin, ymax = self._range_minmax[i].window(ddict['edges'][0], xmin, xmax)
+
+        ydel = 0.05*(ymax - ymin)
+        if ydel == 0:
+            ydel = 0.05*abs(ymax) if ymax != 0 else 1.0
+        axes.set_ylim(ymin-ydel, ymax+ydel)
+
+
+    def _overlay_segments(self, arrays, axes, decimate):
+        """ step outline vertices for each (edges, values) in arrays """
+        if decimate:
+            return [stairs_vertices(*lod_arrays(e, v, axes)) for e, v in arrays]
+        return [stairs_vertices(e, v) for e, v in arrays]
+
+
+    def _display_arrays(self, i, axes):
+        """
+        Returns the decimated (edges, values) to draw for data index i. If the
+        caller supplied pre-decimated 'edges_draw'/'values_draw' arrays (eg.
+        from a prefetch thread) and the axes shows the full x-extent, those
+        are used as is.
+
+        """
+        ddict = self.data[i]
+        e = ddict['edges'][0]
+        h = ddict['values'][0]
+
+        if 'source' in ddict:
+            # virtual waveform, eg. a StairsTimeline, renders itself
+            xmin, xmax = sorted(axes.get_xlim())
+            resolution = 1.0/self._RESIZE_COARSE if self._resizing else 1.0
+            return ddict['source'].render(xmin, xmax, max(int(axes.bbox.width*resolution), 1))
+
+        if self._resizing:
+            return lod_arrays(e, h, axes, resolution=1.0/self._RESIZE_COARSE)
+
+        if 'edges_draw' in ddict:
+            xmin, xmax = axes.get_xlim()
+            if min(xmin, xmax) <= e[0] and max(xmin, xmax) >= e[-1]:
+                return ddict['edges_draw'], ddict['values_draw']
+
+        return lod_arrays(e, h, axes)
 
 
     def _on_move(self, event):
@@ -444,11 +775,33 @@ class PlotPanelStairs(wx.Panel):
         which axis we are in, then call the (hopefully) overloaded on_motion()
         method
 
+        Motion events arrive much faster than the screen refreshes, so we
+        only keep the latest one and process it when the frame timer fires.
+
         """
         if event.inaxes == None or not self.do_motion_event: return
+
+        self._motion_event = event
+        if not self._motion_timer.IsRunning():
+            self._motion_timer.StartOnce(self._MOTION_INTERVAL)
+
+
+    def _on_motion_timer(self, evt):
+
+        event = self._motion_event
+        self._motion_event = None
+        if event is None or event.inaxes is None or not self.do_motion_event: return
+
         x0, y0, x1, y1 = bounds = event.inaxes.dataLim.bounds
 
-        values = self.get_values(event)
+        if self.crosshair:
+            self.ensure_drawn()
+            self._draw_crosshair(event.xdata)
+
+        if self.readout_all or self.crosshair:
+            values = self.get_values_all(event.xdata)
+        else:
+            values = self.get_values(event)
 
         iaxis = None
         for i,axis in enumerate(self.axes):
@@ -458,6 +811,196 @@ class PlotPanelStairs(wx.Panel):
         self.on_motion(event.xdata, event.ydata, values, bounds, iaxis)
 
 
+    def _crosshair_line(self, axes):
+        line = self._crosshair_lines.get(axes)
+        if line is None:
+            # added as a plain artist so the axes data limits are untouched
+            trans = blended_transform_factory(axes.transData, axes.transAxes)
+            line = Line2D([0, 0], [0, 1], transform=trans, animated=True,
+                          visible=False, **self.crosshair_props)
+            axes.add_artist(line)
+            self._crosshair_lines[axes] = line
+        return line
+
+
+    def _crosshair_blit_background(self):
+        if self.events is not None:
+            return self.events.background
+        return self._crosshair_background
+
+
+    def _draw_crosshair(self, xdata, blit=True):
+        """ draw the crosshair at xdata in every visible axes, by blit """
+        background = self._crosshair_blit_background()
+        if background is None: return
+
+        self._crosshair_x = xdata
+        if blit:
+            self.canvas.restore_region(background)
+        for axes in self.axes:
+            line = self._crosshair_line(axes)
+            line.set_xdata([xdata, xdata])
+            line.set_visible(True)
+            axes.draw_artist(line)
+        if blit:
+            for axes in self.axes:
+                self.canvas.blit(axes.bbox)
+
+
+    def _hide_crosshair(self):
+        self._crosshair_x = None
+        for line in self._crosshair_lines.values():
+            line.set_visible(False)
+        background = self._crosshair_blit_background()
+        if background is not None:
+            self.canvas.restore_region(background)
+            self.canvas.blit(self.figure.bbox)
+
+
+    def _on_crosshair_draw(self, event):
+        """ save a clean background, then put the crosshair back on top """
+        if not self.crosshair: return
+        if self.events is None:
+            self._crosshair_background = self.canvas.copy_from_bbox(self.figure.bbox)
+        if self._crosshair_x is not None:
+            self._draw_crosshair(self._crosshair_x, blit=False)
+
+
+    def _on_crosshair_leave(self, event):
+        if self.crosshair:
+            self._hide_crosshair()
+
+
+    def set_crosshair(self, flag):
+        """
+        Turns the crosshair cursor on or off. While on, a vertical line follows
+        the mouse through all visible axes and motion events report the value
+        of every channel at the cursor, as with readout_all.
+
+        """
+        self.crosshair = bool(flag)
+        if self.crosshair:
+            if self.events is None:
+                self._crosshair_background = self.canvas.copy_from_bbox(self.figure.bbox)
+        else:
+            self._hide_crosshair()
+            self._crosshair_background = None
+
+
+    def _view_limits(self):
+        return tuple([(axes.get_xlim(), axes.get_ylim()) for axes in self.all_axes])
+
+
+    def _on_history_draw(self, event):
+        """ keep the render of the current history step if it has none """
+        self._drawn_limits = self._view_limits()
+        if self._history_pos < 0: return
+        entry = self._history[self._history_pos]
+        if entry['region'] is not None or entry['limits'] != self._drawn_limits:
+            return
+        if self.events is not None:
+            # the dispatcher already holds a clean copy of this draw
+            self._set_history_region(entry, self.events.background)
+        else:
+            self._set_history_region(entry, self.canvas.copy_from_bbox(self.figure.bbox))
+
+
+    def _set_history_region(self, entry, region):
+        entry['region'] = region
+        entry['nbytes'] = 4 * int(self.figure.bbox.width) * int(self.figure.bbox.height)
+        self._trim_history()
+
+
+    def _trim_history(self):
+        """ drop cached renders furthest from the current step until under the cap """
+        order = sorted(range(len(self._history)), key=lambda j: abs(j - self._history_pos), reverse=True)
+        total = sum([entry['nbytes'] for entry in self._history])
+        for j in order:
+            if total <= self.history_max_bytes:
+                break
+            total -= self._history[j]['nbytes']
+            self._history[j]['region'] = None
+            self._history[j]['nbytes'] = 0
+
+
+    def clear_history_renders(self):
+        """
+        Forget the cached renders but keep the limits of every step. Needed
+        whenever the same limits would no longer render the same picture, eg.
+        new data, a new canvas size or a layout change.
+
+        """
+        self._drawn_limits = None
+        for entry in self._history:
+            entry['region'] = None
+            entry['nbytes'] = 0
+
+
+    def push_view(self):
+        """
+        Record the current axes limits as a new zoom history step, unless they
+        are already the current step. Any forward steps are discarded. Zoom
+        widgets call this before and after they change the limits.
+
+        """
+        limits = self._view_limits()
+        if self._history_pos >= 0 and self._history[self._history_pos]['limits'] == limits:
+            return
+        del self._history[self._history_pos+1:]
+        entry = {'limits': limits, 'region': None, 'nbytes': 0}
+        self._history.append(entry)
+        if len(self._history) > self.history_max_steps:
+            del self._history[0]
+        self._history_pos = len(self._history) - 1
+
+        # the view being left is usually still on screen from the last draw
+        if self.events is not None and limits == self._drawn_limits:
+            self._set_history_region(entry, self.events.background)
+
+
+    def history_back(self):
+        return self._goto_history(self._history_pos - 1)
+
+    def history_forward(self):
+        return self._goto_history(self._history_pos + 1)
+
+
+    def _goto_history(self, pos):
+        """
+        Show zoom history step pos. A cached render is blitted straight to the
+        screen, otherwise the canvas is drawn. Returns False if there is no
+        such step.
+
+        """
+        if pos < 0 or pos >= len(self._history):
+            return False
+
+        self._history_pos = pos
+        entry = self._history[pos]
+
+        # setting the limits also re-decimates stairs via xlim_changed
+        for axes, (xlim, ylim) in zip(self.all_axes, entry['limits']):
+            axes.set_xlim(xlim)
+            axes.set_ylim(ylim)
+
+        self._async.cancel()
+        if entry['region'] is None:
+            self.canvas.draw()
+        else:
+            self._agg_stale = False
+            self.canvas.restore_region(entry['region'])
+            self.canvas.blit(self.figure.bbox)
+            self._drawn_limits = entry['limits']
+            if self.events is not None:
+                self.events.background = entry['region']
+                if self.crosshair and self._crosshair_x is not None:
+                    self._draw_crosshair(self._crosshair_x)
+            else:
+                # widget blit backgrounds still hold the old view
+                self.canvas.draw_idle()
+        return True
+
+
     def _on_scroll(self, event):
         """
         This is the internal method that organizes the data that is sent to the
@@ -493,14 +1036,27 @@ class PlotPanelStairs(wx.Panel):
         to return a list of data values at the x location of the cursor.
 
         """
-        patch = event.inaxes.patches[0].get_data()
-        nval = len(patch.values)
-        indx = len(np.where(np.round(event.xdata) > patch.edges)[0]) - 1
-        indx = nval-1 if indx >= nval else indx
-        value = patch.values[indx]
+        ddict = self.data[self.all_axes.index(event.inaxes)]
+        if 'source' in ddict:
+            return ddict['source'].value_at(np.round(event.xdata))
+        indx = stairs_index(ddict['edges'][0], np.round(event.xdata))
+        value = ddict['values'][0][indx]
         return value
 
 
+    def get_values_all(self, xdata):
+        """
+        Returns an array with the data value of every axes in all_axes at the
+        x location given. This is one vectorized lookup for all channels.
+
+        """
+        if 'source' in self.data[0]:
+            return np.array([d['source'].value_at(np.round(xdata)) for d in self.data])
+        if self._lookup is None:
+            self._lookup = StairsLookup([(d['edges'][0], d['values'][0]) for d in self.data])
+        return self._lookup.values_at(np.round(xdata))
+
+
     #=======================================================
     #
     #           User Accessible Data Functions
@@ -512,6 +1068,11 @@ class PlotPanelStairs(wx.Panel):
         User can set data into one or all axes using this method.
 
         Data always a dict since we need 'edges' AND 'values' for stairs plot.
+        An optional 'stats' entry (see util_stairs.stairs_stats) saves having
+        to scan the arrays here, otherwise stats are calculated once on entry.
+        An optional 'source' entry, eg. a util_stairs.StairsTimeline, is asked
+        for the arrays to draw and for cursor values instead of using 'edges'
+        and 'values', which then only need to hold a coarse version.
 
         If index is supplied, we assume that only one dict is being
         passed in via the data parameter. If no index is supplied then we
@@ -564,50 +1125,59 @@ class PlotPanelStairs(wx.Panel):
                 item['markevery'] = []
             if 'markevery_color' not in item.keys():
                 item['markevery_color'] = 'green'
+            if 'stats' not in item.keys():
+                item['stats'] = stairs_stats(item['edges'], item['values'])
             item[i] = item
 
         if data[0][0]['edges'].shape[-1] != data[0][0]['values'].shape[-1]+1:
             raise ValueError("len(edges) != len(values)+1, returning")
 
-        if index:
+        if index is not None:
             if index < 0 or index >= self.naxes:
                 raise ValueError("index must be within that number of axes in the plot_panel")
+        elif len(data) != self.naxes:
+            raise ValueError("data must be a list with naxes number of ndarrays")
+
+        for dat in data:
+
+            d = dat['edges']
+            padding = 2 - len(d.shape)
+            if padding > 0:
+                d.shape = ([1] * padding) + list(d.shape)
+            elif padding == 0:
+                # Nothing to do; data already has correct number of dims
+                pass
+            else:
+                # padding < 0 ==> data has too many dims
+                raise ValueError("Edges with shape %s has too many dimensions" % str(item.shape))
+
+            d = dat['values']
+            padding = 2 - len(d.shape)
+            if padding > 0:
+                d.shape = ([1] * padding) + list(d.shape)
+            elif padding == 0:
+                # Nothing to do; data already has correct number of dims
+                pass
+            else:
+                # padding < 0 ==> data has too many dims
+                raise ValueError("Values with shape %s has too many dimensions" % str(item.shape))
+
+        self._lookup = None
+        self.clear_history_renders()
 
+        if index is not None:
             # even though we are inserting into an index, I want to force users
             # to submit a dict in a list of lists format so it is consistent
             # with submitting a whole new set of data (below). We just take the
             # first list of dicts from the submitted data and put it in the
             # index position
             self.data[index] = data[0]
+            self._range_minmax[index] = None
+            self._integrals[index] = None
 
         else:
-            if len(data) != self.naxes:
-                raise ValueError("data must be a list with naxes number of ndarrays")
-
-            for dat in data:
-
-                d = dat['edges']
-                padding = 2 - len(d.shape)
-                if padding > 0:
-                    d.shape = ([1] * padding) + list(d.shape)
-                elif padding == 0:
-                    # Nothing to do; data already has correct number of dims
-                    pass
-                else:
-                    # padding < 0 ==> data has too many dims
-                    raise ValueError("Edges with shape %s has too many dimensions" % str(item.shape))
-
-                d = dat['values']
-                padding = 2 - len(d.shape)
-                if padding > 0:
-                    d.shape = ([1] * padding) + list(d.shape)
-                elif padding == 0:
-                    # Nothing to do; data already has correct number of dims
-                    pass
-                else:
-                    # padding < 0 ==> data has too many dims
-                    raise ValueError("Values with shape %s has too many dimensions" % str(item.shape))
-
+            self._range_minmax = [None for item in range(self.naxes)]
+            self._integrals = [None for item in range(self.naxes)]
             self.data = data
 
 
@@ -626,6 +1196,9 @@ class PlotPanelStairs(wx.Panel):
         if set_scale:
             self._calculate_scale()
         self.update_axes()
+        if self.autoy:
+            for i, axes in enumerate(self.all_axes):
+                self._fit_ylim(i, axes)
         if not no_draw:
             self.canvas.draw()
 
@@ -662,10 +1235,9 @@ class PlotPanelStairs(wx.Panel):
 
             color = ddict['line_color_real']
 
-            h = ddict['values'][0].copy()
-            e = ddict['edges'][0].copy()
+            e, h = self._display_arrays(i, axes)
 
-            axes.stairs(h, e, color=color, linewidth=width)
+            self._stairs[i] = axes.stairs(h, e, color=color, linewidth=width, gid='stairs%d' % i)
 
 
             # zero line
@@ -686,6 +1258,81 @@ class PlotPanelStairs(wx.Panel):
             #     axes.set_xlim(old_xmin,old_xmax)
 
 
+    def update_axis(self, index, data=None, set_scale=False):
+        """
+        Fast path for changing the data of one axes only, eg. a derived or
+        streaming channel. Optionally sets a new data dict for the axes
+        (see set_data), refreshes the stairs artist in that axes, and rescales
+        it if set_scale is True (or autoy is on). Then just that axes is drawn
+        and blitted, the rest of the figure is not touched.
+
+        Tick labels outside the axes box are not redrawn until the next full
+        canvas.draw(), so rescaling is best left to the full update() path
+        when the x-axis is shown.
+
+        """
+        if data is not None:
+            self.set_data([data], index=index)
+
+        axes = self.all_axes[index]
+        ddict = self.data[index]
+
+        if self._stairs[index] is None:
+            self.update()
+            return
+
+        e, h = self._display_arrays(index, axes)
+        self._stairs[index].set_data(h, e)
+        self._stairs[index].set_edgecolor(ddict['line_color_real'])
+
+        if set_scale:
+            stats = ddict['stats']
+            ymax = max(abs(stats['ymin']), abs(stats['ymax']))
+            if ymax == 0: ymax = 1.0
+            self.dataymax[index] = ymax
+            self.vertical_scale[index] = ymax
+            axes.ignore_existing_data_limits = True
+            axes.update_datalim([[stats['xmin'], -ymax], [stats['xmax'], ymax]])
+            ydel = self.yscale_bump*2*ymax
+            axes.set_ylim(-ymax-ydel, ymax+ydel)
+        elif self.autoy:
+            self._fit_ylim(index, axes)
+
+        if axes in self.axes:
+            self._draw_axes(axes)
+
+
+    def _draw_axes(self, axes):
+        """ draw one axes into the Agg renderer and blit just its area """
+        if self._agg_stale:
+            self.canvas.draw()
+            return
+
+        # start from the clean background so the crosshair or a zoom box
+        # blitted earlier do not end up baked into the new background
+        background = self._crosshair_blit_background()
+        if background is not None:
+            self.canvas.restore_region(background)
+
+        axes.draw(self.canvas.get_renderer())
+
+        if self.events is not None:
+            self.events.background = self.canvas.copy_from_bbox(self.figure.bbox)
+        elif self.crosshair:
+            self._crosshair_background = self.canvas.copy_from_bbox(self.figure.bbox)
+
+        if self.crosshair and self._crosshair_x is not None:
+            self._draw_crosshair(self._crosshair_x)
+        else:
+            self.canvas.blit(axes.bbox)
+
+
+    def refresh_stairs(self):
+        """ re-decimate all stairs artists, eg. after the axes size changed """
+        for axes in self.all_axes:
+            self._on_xlim_changed(axes)
+
+
     def get_data(self, index):
         """ Return a copy of one and only one of the data sets. """
         if index < 0 or index >= self.naxes:
@@ -701,31 +1348,40 @@ class PlotPanelStairs(wx.Panel):
         and position of zero line.
 
         """
-        x0, y0, x1, y1 = self.all_axes[0].dataLim.bounds
+        xmin, xmax = self._data_extent()
 
         ymax = self.vertical_scale
         ymin = [-1* item for item in ymax]
 
-        bot = 0.075 if self.prefs.xaxis_show else 0.0
-        top = 0.95 if self.prefs.title_show else 1.0
-        self.figure.subplots_adjust(left=0.0, right=0.999,
-                                    bottom=bot, top=top,
-                                    wspace=0.0, hspace=0.0)
+        # margins, x-axis and titles only change with these settings, so
+        # there is no need to redo them on every data update
+        format_key = (self.prefs.xaxis_show, self.prefs.title_show,
+                      tuple(self.plot_titles), self.xtitle)
 
-        if self.prefs.xaxis_show:
-            self.all_axes[self.naxes-1].xaxis.set_visible(True)
-        else:
-            self.all_axes[self.naxes-1].xaxis.set_visible(False)
+        if format_key != self._format_key:
+            self._format_key = format_key
+            self.clear_history_renders()
+
+            bot = 0.075 if self.prefs.xaxis_show else 0.0
+            top = 0.95 if self.prefs.title_show else 1.0
+            self.figure.subplots_adjust(left=0.0, right=0.999,
+                                        bottom=bot, top=top,
+                                        wspace=0.0, hspace=0.0)
+
+            if self.prefs.xaxis_show:
+                self.all_axes[self.naxes-1].xaxis.set_visible(True)
+            else:
+                self.all_axes[self.naxes-1].xaxis.set_visible(False)
 
-        self.all_axes[self.naxes-1].set_xlabel(self.xtitle)
+            self.all_axes[self.naxes-1].set_xlabel(self.xtitle)
 
-        if self.prefs.title_show:
-            if self.plot_titles:
+            if self.prefs.title_show:
+                if self.plot_titles:
+                    for i in range(self.naxes):
+                        self.all_axes[i].set_title(self.plot_titles[i], y=0.9)
+            else:
                 for i in range(self.naxes):
-                    self.all_axes[i].set_title(self.plot_titles[i], y=0.9)
-        else:
-            for i in range(self.naxes):
-                self.all_axes[i].set_title('', y=0.9)
+                    self.all_axes[i].set_title('', y=0.9)
 
         # set axes on/off and use appropriate title
         for j, axes in enumerate(self.all_axes):
@@ -735,7 +1391,18 @@ class PlotPanelStairs(wx.Panel):
 
             # set zero line at top/middle/bottom of plot
             axes.ignore_existing_data_limits = True
-            axes.update_datalim([[x0,-self.dataymax[j]],[x0+x1,self.dataymax[j]]])
+            axes.update_datalim([[xmin,-self.dataymax[j]],[xmax,self.dataymax[j]]])
+
+
+    def data_bounds(self, axes):
+        """
+        Returns the data bounds of axes as (x0, y0, width, height), the same
+        layout as axes.dataLim.bounds, from the precomputed data stats.
+
+        """
+        xmin, xmax = self._data_extent()
+        ymax = self.dataymax[self.all_axes.index(axes)]
+        return xmin, -ymax, xmax-xmin, 2*ymax
 
 
     def reset_xlim(self):
@@ -812,6 +1479,24 @@ class PlotPanelStairs(wx.Panel):
         self.canvas.draw()
 
 
+    def set_autoy(self, flag):
+        """
+        Turns auto-y mode on or off. While on, every x-range change refits
+        the y-range of each axes to the data it shows. Turning it off puts
+        back the +/- vertical_scale y-range.
+
+        """
+        self.autoy = bool(flag)
+        for i, axes in enumerate(self.all_axes):
+            if self.autoy:
+                self._fit_ylim(i, axes)
+            else:
+                maxy = self.vertical_scale[i]
+                if maxy == 0: maxy = 1
+                axes.set_ylim([-maxy, maxy])
+        self.canvas.draw()
+
+
     def set_vertical_scale_abs(self, val, reset_max=False):
         '''
 
@@ -834,19 +1519,58 @@ class PlotPanelStairs(wx.Panel):
         Calculates & returns the area and rms area selected between the
         reference lines.
 
+        '''
+        all_areas, all_means, all_rms = self.calculate_integrals()
+        return all_areas, all_rms
+
+
+    def calculate_integrals(self):
+        '''
+        Returns lists of the area, mean and RMS of every channel between the
+        reference lines. Each channel keeps prefix sums of value*width and
+        value**2*width (see util_stairs.StairsIntegrals), built the first
+        time they are needed for the current data, so moving the cursors
+        costs a few binary searches per channel. Segments cut by a cursor
+        count for exactly the part inside the span.
+
         '''
         rstr, rend = self.ref_locations
         if rstr > rend: rstr, rend = rend, rstr
 
         all_areas = []
+        all_means = []
         all_rms = []
-        for axes in self.all_axes:
-            # TODO bjs - fix this for stairs
+        for i, ddict in enumerate(self.data):
+            if 'source' in ddict:
+                integrals = ddict['source']
+            else:
+                if self._integrals[i] is None:
+                    self._integrals[i] = StairsIntegrals(ddict['edges'][0], ddict['values'][0])
+                integrals = self._integrals[i]
 
-            all_areas.append(0.0)
-            all_rms.append(0.0)
+            area, mean, rms = integrals.area(rstr, rend)
+            all_areas.append(area)
+            all_means.append(mean)
+            all_rms.append(rms)
 
-        return all_areas, all_rms
+        return all_areas, all_means, all_rms
+
+
+    def refs_axes_index(self, iplot=None):
+        '''
+        Returns the index into all_axes of the axes that the current reference
+        cursor event came from. In unlink mode every CursorSpan has only its
+        own axes, so iplot is always 0 and we look for the one being dragged.
+
+        '''
+        if self.unlink:
+            for refs in self.refs:
+                if refs.pressv is not None:
+                    return self.all_axes.index(refs.axes[0])
+            return None
+        if iplot is None:
+            return None
+        return self.all_axes.index(self.axes[iplot])
 
 
     def rms(self, data):
@@ -873,6 +1597,234 @@ class PlotPanelStairs(wx.Panel):
         if len(items) == self.naxes:
             self.plot_titles = [str(item) for item in items]
 
+    def view_key(self):
+        """
+        Returns a hashable description of everything, other than the data,
+        that determines what the canvas looks like. Bitmaps rendered offscreen
+        can only be shown in place of a real draw if their key matches.
+
+        """
+        key = [tuple(self.canvas.get_width_height()),
+               tuple(self.show_flags),
+               tuple(self.plot_titles),
+               self.prefs.zero_line_plot_show,
+               self.prefs.xaxis_show,
+               self.prefs.title_show,
+               self._overlay_count]
+        for axes in self.axes:
+            key.append((tuple(axes.get_xlim()), tuple(axes.get_ylim())))
+        return tuple(key)
+
+    def figure_template(self):
+        """
+        Returns a pickled copy of the figure for use in render_figure_agg(),
+        with the stairs data left out, see stairs_arrays(). Pickling takes
+        a while, so the template is kept until the view key, line colors or
+        widths change, and stepping through nodes only sends new data.
+
+        """
+        key = (self.view_key(), tuple(self.line_width),
+               tuple([tuple(item.get_edgecolor()) for item in self._stairs if item is not None]))
+        if key != self._template_key:
+            saved = [(item, item.get_data()) for item in self._stairs if item is not None]
+            try:
+                for item, data in saved:
+                    item.set_data(np.zeros(1), np.arange(2.0))
+                self._template = pickle.dumps(self.figure)
+            finally:
+                for item, data in saved:
+                    item.set_data(data.values, data.edges)
+            self._template_key = key
+        return self._template
+
+    def stairs_arrays(self):
+        """ axes index -> (edges, values) drawn by the stairs artists now """
+        arrays = {}
+        for i, item in enumerate(self._stairs):
+            if item is not None:
+                data = item.get_data()
+                arrays[i] = (data.edges, data.values)
+        return arrays
+
+    def show_bitmap(self, width, height, buffer):
+        """
+        Paints an offscreen rendered RGBA buffer straight onto the canvas
+        without drawing the figure. Typically followed by a draw_idle() so
+        that the canvas is brought properly up to date once events quiet down.
+
+        """
+        if (width, height) != tuple(self.canvas.get_width_height()):
+            return False
+        self._async.cancel()
+        self.canvas.bitmap = wx.Bitmap.FromBufferRGBA(width, height, buffer)
+        self.canvas.gui_repaint()
+        self._agg_stale = True
+        return True
+
+    def draw_async(self):
+        """
+        Use in place of canvas.draw() to render the figure in a worker thread.
+        The finished bitmap is swapped in on the GUI thread, unless a newer
+        draw_async() or a real canvas.draw() came along in the meantime.
+
+        """
+        self._async.submit(self.figure_template(), self.stairs_arrays())
+
+    def cancel_async(self):
+        self._async.cancel()
+
+    def stop_async(self):
+        self._async.stop()
+
+    def ensure_drawn(self):
+        """ make the canvas Agg renderer match the screen again if needed """
+        if self._agg_stale:
+            self.canvas.draw()
+
+    def _on_async_result(self, generation, result):
+        # called in the worker thread
+        wx.CallAfter(self._show_async_result, generation, result)
+
+    def _show_async_result(self, generation, result):
+        if generation == self._async.generation:
+            self.show_bitmap(*result)
+
+    def _on_async_press(self, event):
+        self.ensure_drawn()
+
+    def _on_async_draw(self, event):
+        # a real draw supersedes any render still in the worker
+        self._async.cancel()
+        self._agg_stale = False
+
+    def set_overlay(self, overlays, colors=None, decimate=True, linewidth=None):
+        """
+        Draws many stairs waveforms on top of each other, eg. the same channel
+        across a range of nodes. Each axes gets a single LineCollection, which
+        is far cheaper to draw and pan than one artist per waveform.
+
+        overlays - list with one entry per axes in all_axes, each a list of
+                   (edges, values) tuples or None to leave that axes empty.
+        colors   - list of colors, one per waveform. Defaults to a viridis
+                   ramp from first to last waveform.
+        decimate - if True, every waveform is decimated to screen resolution
+                   and rebuilt when the x-range changes, otherwise the full
+                   data is used once.
+
+        """
+        self.clear_overlay()
+
+        if linewidth is None:
+            linewidth = self.prefs.line_width
+
+        for i, axes in enumerate(self.all_axes):
+            if not overlays[i]:
+                continue
+            arrays = [(np.asarray(e).ravel(), np.asarray(v).ravel()) for e, v in overlays[i]]
+            if colors is None:
+                cmap = matplotlib.colormaps['viridis']
+                clrs = cmap(np.linspace(0.0, 1.0, len(arrays)), alpha=0.5)
+            else:
+                clrs = colors
+            collection = LineCollection(self._overlay_segments(arrays, axes, decimate),
+                                        colors=clrs,
+                                        linewidths=linewidth,
+                                        zorder=0.9,             # under the stairs
+                                        gid='overlay%d' % i)
+            axes.add_collection(collection, autolim=False)
+            self._overlay[i] = {'arrays'     : arrays,
+                                'decimate'   : decimate,
+                                'collection' : collection}
+        self._overlay_count += 1
+
+    def clear_overlay(self):
+        """ remove all overlay collections, needs a canvas draw to show """
+        for i, overlay in enumerate(self._overlay):
+            if overlay is not None:
+                overlay['collection'].remove()
+                self._overlay[i] = None
+        self._overlay_count += 1
+
+    def set_curves(self, curves, color='red', linewidth=None):
+        """
+        Draws a plain line on top of the stairs in some of the axes, eg. the
+        running integral of a channel. Unlike set_overlay() the points are
+        joined directly and are not decimated. Each line is a one segment
+        LineCollection, so that it survives the axes.lines reset in
+        update_plots() and does not change the axes limits.
+
+        curves - list with one entry per axes in all_axes, each an (x, y)
+                 tuple of arrays or None to leave that axes empty.
+
+        """
+        self.clear_curves()
+
+        if linewidth is None:
+            linewidth = self.prefs.line_width
+
+        for i, axes in enumerate(self.all_axes):
+            if curves[i] is None:
+                continue
+            x, y = curves[i]
+            verts = np.column_stack((np.asarray(x).ravel(), np.asarray(y).ravel()))
+            collection = LineCollection([verts],
+                                        colors=color,
+                                        linewidths=linewidth,
+                                        zorder=2.1,             # over the stairs
+                                        gid='curve%d' % i)
+            axes.add_collection(collection, autolim=False)
+            self._curves[i] = collection
+        self._overlay_count += 1
+
+    def clear_curves(self):
+        """ remove all curves, needs a canvas draw to show """
+        for i, collection in enumerate(self._curves):
+            if collection is not None:
+                collection.remove()
+                self._curves[i] = None
+        self._overlay_count += 1
+
+    def start_animation(self):
+        """
+        Prepares for fast repeated data updates via animate_data(). The stairs
+        artists are marked animated and the figure is drawn once without them
+        to capture a background that each frame is blitted on top of.
+
+        """
+        for patch in self._stairs:
+            if patch is not None:
+                patch.set_animated(True)
+        self.canvas.draw()
+        self._anim_background = self.canvas.copy_from_bbox(self.figure.bbox)
+
+    def animate_data(self, data):
+        """
+        Replaces the data in all axes and redraws only the stairs artists on
+        the background saved by start_animation(). Axes and limits are not
+        touched, so this is much cheaper than update() plus a canvas draw.
+
+        """
+        if self._anim_background is None:
+            return
+        self.set_data(data)
+        self.canvas.restore_region(self._anim_background)
+        for i, axes in enumerate(self.all_axes):
+            patch = self._stairs[i]
+            if patch is None or axes not in self.axes:
+                continue
+            e, h = self._display_arrays(i, axes)
+            patch.set_data(h, e)
+            axes.draw_artist(patch)
+        self.canvas.blit(self.figure.bbox)
+
+    def stop_animation(self):
+        """ return stairs to normal artists and do a full redraw """
+        self._anim_background = None
+        for patch in self._stairs:
+            if patch is not None:
+                patch.set_animated(False)
+        self.canvas.draw()
+
     def refresh_cursors(self):
         """ redraws the reference cursor span on user request """
         if self.refs == None: return
@@ -900,6 +1852,7 @@ class PlotPanelStairs(wx.Panel):
             return
 
         self.axes = self.all_axes[0:n]
+        self._layout_key = None
 
         self.show_flags = [False for i in range(self.naxes)]
         for i in range(n): self.show_flags[i] = True
@@ -931,6 +1884,7 @@ class PlotPanelStairs(wx.Panel):
             for i, ax in enumerate(self.figure.axes):
                 ax.change_geometry(n, 1, i+1)
 
+        self.clear_history_renders()
         self.canvas.draw()
 
 
@@ -946,6 +1900,12 @@ class PlotPanelStairs(wx.Panel):
         This method also updates the axes lists in the zoom, refs and middle
         functor methods.
 
+        The SubplotSpecs for each combination of flags and title/x-axis prefs
+        are saved in self._layouts, so switching back to a combination seen
+        before skips building a new GridSpec. Only axes whose visibility
+        changed are removed from or added to the figure, and nothing at all
+        is done if the layout is the same as the current one.
+
         """
 
         # TODO bjs - may be broken by mpl 3.5.x deprecate of change_geometry()
@@ -959,15 +1919,20 @@ class PlotPanelStairs(wx.Panel):
 
         n = flags.count(True)
 
-        faxes = list(self.figure.axes)
-        for axes in faxes:
-            self.figure.delaxes(axes)
+        key = (tuple([bool(item) for item in flags]), self.prefs.xaxis_show, self.prefs.title_show)
+        if key == self._layout_key:
+            self.show_flags = flags
+            return
 
-        self.axes = []
-        for i, axes in enumerate(self.all_axes):
-            if flags[i] != False:
-                self.axes.append(self.figure.add_axes(axes))
+        wanted = [axes for i, axes in enumerate(self.all_axes) if flags[i]]
+        for axes in list(self.figure.axes):
+            if axes not in wanted:
+                self.figure.delaxes(axes)
+        for axes in wanted:
+            if axes not in self.figure.axes:
+                self.figure.add_axes(axes)
 
+        self.axes = wanted
         self.show_flags = flags
 
         if not self.unlink:
@@ -981,14 +1946,19 @@ class PlotPanelStairs(wx.Panel):
                 self.middle.axes = self.axes
 
         if flag35:
-            gs = matplotlib.gridspec.GridSpec(n, 1)
-            for i, ax in enumerate(self.figure.axes):
-                ax.set_position(gs[i].get_position(self.figure))
-                ax.set_subplotspec(gs[i])
+            specs = self._layouts.get(key)
+            if specs is None:
+                gs = matplotlib.gridspec.GridSpec(n, 1)
+                specs = [gs[i] for i in range(n)]
+                self._layouts[key] = specs
+            for ax, spec in zip(self.axes, specs):
+                ax.set_subplotspec(spec)
         else:
-            for i, ax in enumerate(self.figure.axes):
+            for i, ax in enumerate(self.axes):
                 ax.change_geometry(n, 1, i+1)
 
+        self._layout_key = key
+        self.clear_history_renders()
         self.canvas.draw()
 
 
@@ -1064,6 +2034,77 @@ class PlotPanelStairs(wx.Panel):
 
 
 
+class EventDispatcher:
+    """
+    Single set of canvas callbacks shared by the per-axes zoom, cursor and
+    middle button widgets that PlotPanelStairs creates in unlink mode.
+
+    Without it, every widget connects its own motion, press, release and
+    draw callbacks, so each mouse event runs through all of them and each
+    draw copies the whole figure once per widget for a blit background.
+    Here a press is routed only to the widgets attached to event.inaxes,
+    motion and release go only to the widgets that took the press, and one
+    background is grabbed per draw for everyone to blit on top of.
+
+    Widgets register by way of their 'dispatcher' keyword argument.
+
+    """
+
+    def __init__(self, canvas):
+
+        self.canvas = canvas
+        self.background = None
+
+        self._widgets = {}      # axes -> list of widgets attached to it
+        self._active  = []      # widgets that took the last button press
+
+        self.cids = [self.canvas.mpl_connect('motion_notify_event', self.onmove),
+                     self.canvas.mpl_connect('button_press_event', self.press),
+                     self.canvas.mpl_connect('button_release_event', self.release),
+                     self.canvas.mpl_connect('draw_event', self.update_background)]
+
+
+    def add(self, widget):
+        """ (re)attach widget to the axes in its widget.axes list """
+        for widgets in self._widgets.values():
+            if widget in widgets:
+                widgets.remove(widget)
+        for axes in widget.axes:
+            self._widgets.setdefault(axes, []).append(widget)
+
+    def disconnect(self):
+        for cid in self.cids:
+            self.canvas.mpl_disconnect(cid)
+        self.cids = []
+
+    def update_background(self, event):
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+
+    def restore_region(self):
+        if self.background is not None:
+            self.canvas.restore_region(self.background)
+
+    def blit(self, axes_list):
+        """ blit only the area of the given axes to the screen """
+        for axes in axes_list:
+            self.canvas.blit(axes.bbox)
+
+    def press(self, event):
+        self._active = list(self._widgets.get(event.inaxes, []))
+        for widget in self._active:
+            widget.press(event)
+
+    def onmove(self, event):
+        for widget in self._active:
+            widget.onmove(event)
+
+    def release(self, event):
+        active, self._active = self._active, []
+        for widget in active:
+            widget.release(event)
+
+
+
 class ZoomSpan:
     """
     Select a min/max range of the x or y axes for a matplotlib Axes
@@ -1087,7 +2128,8 @@ class ZoomSpan:
                                useblit=False,
                                rectprops=None,
                                do_zoom_select_event=False,
-                               do_zoom_motion_event=False):
+                               do_zoom_motion_event=False,
+                               dispatcher=None):
         """
         Create a span selector in axes.  When a selection is made, clear
         the span and call onselect with
@@ -1112,6 +2154,7 @@ class ZoomSpan:
         self.canvas = None
         self.visible = True
         self.cids = []
+        self.dispatcher = dispatcher
 
         self.rect = []
         self.background = None
@@ -1133,7 +2176,11 @@ class ZoomSpan:
 
     def new_axes(self,axes):
         self.axes = axes
-        if self.canvas is not axes[0].figure.canvas:
+        if self.dispatcher is not None:
+            # events and blit background come from the panel's dispatcher
+            self.canvas = axes[0].figure.canvas
+            self.dispatcher.add(self)
+        elif self.canvas is not axes[0].figure.canvas:
             for cid in self.cids:
                 self.canvas.mpl_disconnect(cid)
 
@@ -1207,8 +2254,9 @@ class ZoomSpan:
 
         # left-click in place resets the x-axis
         if event.xdata == self.pressv:
+            self.parent.push_view()
             for axes in self.axes:
-                x0, y0, x1, y1 = axes.dataLim.bounds
+                x0, y0, x1, y1 = self.parent.data_bounds(axes)
                 xdel = self.parent.xscale_bump*(x1-x0)
                 ydel = self.parent.yscale_bump*(y1-y0) / 1.1
                 axes.set_xlim(x0-xdel,x0+x1+xdel)
@@ -1217,6 +2265,7 @@ class ZoomSpan:
                 # 10:1 ratio is set by set_ylim() method when the zeroline is
                 # at the top or bottom.
                 axes.set_ylim(y0-ydel*0.1,y0+y1+ydel)
+            self.parent.push_view()
             self.canvas.draw()
 
             if self.do_zoom_select_event:
@@ -1231,8 +2280,10 @@ class ZoomSpan:
         span = vmax - vmin
         if self.minspan is not None and span<self.minspan: return
 
+        self.parent.push_view()
         for axes in self.axes:
             axes.set_xlim((vmin, vmax))
+        self.parent.push_view()
         self.canvas.draw()
 
         if event.inaxes is not None:
@@ -1250,7 +2301,12 @@ class ZoomSpan:
 
     def update(self):
         'draw using newfangled blit or oldfangled draw depending on useblit'
-        if self.useblit:
+        if self.useblit and self.dispatcher is not None:
+            self.dispatcher.restore_region()
+            for axes, rect in zip(self.axes, self.rect):
+                axes.draw_artist(rect)
+            self.dispatcher.blit(self.axes)
+        elif self.useblit:
             if self.background is not None:
                 self.canvas.restore_region(self.background)
             for axes, rect in zip(self.axes, self.rect):
@@ -1311,7 +2367,8 @@ class CursorSpan:
                                useblit=False,
                                rectprops=None,
                                do_refs_select_event=False,
-                               do_refs_motion_event=False):
+                               do_refs_motion_event=False,
+                               dispatcher=None):
         """
         Create a span selector in axes.  When a selection is made, clear
         the span and call onselect with
@@ -1338,6 +2395,7 @@ class CursorSpan:
         self.canvas = None
         self.visible = True
         self.cids = []
+        self.dispatcher = dispatcher
 
         self.rect = []
         self.background = None
@@ -1374,7 +2432,11 @@ class CursorSpan:
 
     def new_axes(self,axes):
         self.axes = axes
-        if self.canvas is not axes[0].figure.canvas:
+        if self.dispatcher is not None:
+            # events and blit background come from the panel's dispatcher
+            self.canvas = axes[0].figure.canvas
+            self.dispatcher.add(self)
+        elif self.canvas is not axes[0].figure.canvas:
             for cid in self.cids:
                 self.canvas.mpl_disconnect(cid)
 
@@ -1491,7 +2553,12 @@ class CursorSpan:
 
     def update(self):
         'draw using newfangled blit or oldfangled draw depending on useblit'
-        if self.useblit:
+        if self.useblit and self.dispatcher is not None:
+            self.dispatcher.restore_region()
+            for axes, rect in zip(self.axes, self.rect):
+                axes.draw_artist(rect)
+            self.dispatcher.blit(self.axes)
+        elif self.useblit:
             if self.background is not None:
                 self.canvas.restore_region(self.background)
             for axes, rect in zip(self.axes, self.rect):
@@ -1581,7 +2648,8 @@ class ZoomBox:
                              do_zoom_select_event=False,
                              do_zoom_motion_event=False,
                              spancoords='data',
-                             button=None):
+                             button=None,
+                             dispatcher=None):
 
         """
         Create a selector in axes.  When a selection is made, clear
@@ -1626,6 +2694,7 @@ class ZoomBox:
         self.canvas = None
         self.visible = True
         self.cids = []
+        self.dispatcher = dispatcher
 
         self.active = True                    # for activation / deactivation
         self.to_draw = []
@@ -1655,7 +2724,11 @@ class ZoomBox:
 
     def new_axes(self,axes, rectprops=None):
         self.axes = axes
-        if self.canvas is not axes[0].figure.canvas:
+        if self.dispatcher is not None:
+            # events and blit background come from the panel's dispatcher
+            self.canvas = axes[0].figure.canvas
+            self.dispatcher.add(self)
+        elif self.canvas is not axes[0].figure.canvas:
             for cid in self.cids:
                 self.canvas.mpl_disconnect(cid)
 
@@ -1745,12 +2818,14 @@ class ZoomBox:
 
         # left-click in place resets the x-axis or y-axis
         if self.eventpress.xdata == event.xdata and self.eventpress.ydata == event.ydata:
+            self.parent.push_view()
             for axes in self.axes:
-                x0, y0, x1, y1 = event.inaxes.dataLim.bounds
+                x0, y0, x1, y1 = self.parent.data_bounds(axes)
                 xdel = self.parent.xscale_bump*(x1-x0)
                 ydel = self.parent.yscale_bump*(y1-y0)
                 axes.set_xlim(x0-xdel,x0+x1+xdel)
                 axes.set_ylim(y0-ydel,y0+y1+ydel)
+            self.parent.push_view()
             self.canvas.draw()
 
             if self.do_zoom_select_event:
@@ -1789,9 +2864,12 @@ class ZoomBox:
             """Box too small"""    # check if drawed distance (if it exists) is
             return                 # not to small in neither x nor y-direction
 
+        self.parent.push_view()
         for axes in self.axes:
             axes.set_xlim((xmin,xmax))
-            axes.set_ylim((ymin,ymax))
+            if not self.parent.autoy:
+                axes.set_ylim((ymin,ymax))
+        self.parent.push_view()
         self.canvas.draw()
 
         data_test = event.inaxes.patches!=[]
@@ -1810,7 +2888,12 @@ class ZoomBox:
 
     def update(self):
         'draw using newfangled blit or oldfangled draw depending on useblit'
-        if self.useblit:
+        if self.useblit and self.dispatcher is not None:
+            self.dispatcher.restore_region()
+            for axes, to_draw in zip(self.axes, self.to_draw):
+                axes.draw_artist(to_draw)
+            self.dispatcher.blit(self.axes)
+        elif self.useblit:
             if self.background is not None:
                 self.canvas.restore_region(self.background)
             for axes, to_draw in zip(self.axes, self.to_draw):
@@ -1880,7 +2963,8 @@ class MiddleEvents:
     def __init__(self, parent, axes,
                                do_middle_select_event=False,
                                do_middle_motion_event=False,
-                               do_middle_press_event=False):
+                               do_middle_press_event=False,
+                               dispatcher=None):
         """
         Create a span selector in axes.  When a selection is made, clear
         the span and call onselect with
@@ -1904,6 +2988,7 @@ class MiddleEvents:
         self.axes = None
         self.canvas = None
         self.cids = []
+        self.dispatcher = dispatcher
 
         self.background = None
         self.pressxy = None
@@ -1922,7 +3007,11 @@ class MiddleEvents:
 
     def new_axes(self,axes):
         self.axes = axes
-        if self.canvas is not axes[0].figure.canvas:
+        if self.dispatcher is not None:
+            # events and blit background come from the panel's dispatcher
+            self.canvas = axes[0].figure.canvas
+            self.dispatcher.add(self)
+        elif self.canvas is not axes[0].figure.canvas:
             for cid in self.cids:
                 self.canvas.mpl_disconnect(cid)
 
@@ -0,0 +1,774 @@
+"""
+Numerical helpers for stairs (piecewise constant) waveforms.
+
+A stairs waveform is described by an 'edges' array and a 'values' array,
+where len(edges) = len(values)+1 and values[i] holds between edges[i] and
+edges[i+1]. These routines are all vectorized with numpy so that they stay
+fast on channels with millions of segments.
+
+"""
+
+# Python modules
+import lzma
+import collections
+import zlib
+import struct
+
+# 3rd party modules
+import numpy as np
+
+# Our modules
+
+
+
+def decimate_stairs(edges, values, nbins, xmin=None, xmax=None):
+    """
+    Reduce a stairs waveform to a min/max envelope for display.
+
+    The x-range [xmin, xmax] (default is the full extent) is split into
+    nbins equal bins, typically one per screen pixel. Each bin is replaced
+    by two steps holding the min and max value of all segments overlapping
+    that bin, so peaks survive decimation. If the window already contains
+    2*nbins segments or fewer, the segments are returned as is.
+
+    Returns new (edges, values) arrays.
+
+    """
+    edges = np.asarray(edges).ravel()
+    values = np.asarray(values).ravel()
+    nbins = max(int(nbins), 1)
+
+    xmin = edges[0] if xmin is None else max(xmin, edges[0])
+    xmax = edges[-1] if xmax is None else min(xmax, edges[-1])
+    if xmax <= xmin:
+        # window does not overlap the data, keep one segment so artists
+        # still have something valid to hold
+        return edges[0:2], values[0:1]
+
+    i0, i1 = stairs_window(edges, xmin, xmax)
+
+    if i1 - i0 <= 2*nbins:
+        return edges[i0:i1+1], values[i0:i1]
+
+    bounds = np.linspace(xmin, xmax, nbins+1)
+    starts = _search_edges(edges, bounds[:-1], side='right') - 1
+    starts = np.clip(starts, i0, i1-1)
+
+    vals = values[:i1]
+    vmin = np.minimum.reduceat(vals, starts)
+    vmax = np.maximum.reduceat(vals, starts)
+
+    # reduceat stops short of the segment that straddles the right side of
+    # each bin, fold that one in explicitly
+    nxt = starts[1:]
+    spill = edges[nxt] < bounds[1:-1]
+    vmin[:-1][spill] = np.minimum(vmin[:-1][spill], values[nxt[spill]])
+    vmax[:-1][spill] = np.maximum(vmax[:-1][spill], values[nxt[spill]])
+
+    return _envelope_steps(bounds, vmin, vmax)
+
+
+def _envelope_steps(bounds, vmin, vmax):
+    """ a min step and a max step in each bin, see decimate_stairs() """
+    nbins = len(bounds) - 1
+    e = np.empty(2*nbins+1, dtype=float)
+    e[0::2] = bounds
+    e[1::2] = 0.5*(bounds[:-1] + bounds[1:])
+
+    v = np.empty(2*nbins, dtype=vmin.dtype)
+    v[0::2] = vmin
+    v[1::2] = vmax
+
+    return e, v
+
+
+def _search_edges(edges, x, side):
+    """
+    np.searchsorted() of float x in edges. Integer edges would be copied to
+    float for every call, so x is rounded to an integer that gives the same
+    answer instead.
+
+    """
+    if edges.dtype.kind not in 'iu' or len(edges) == 0:
+        return np.searchsorted(edges, x, side=side)
+    x = np.asarray(x, dtype=float)
+    xi = np.floor(x) if side == 'right' else np.ceil(x)
+    xi = np.clip(xi, edges[0], edges[-1]).astype(edges.dtype)
+    indx = np.searchsorted(edges, xi, side=side)
+    return np.where(x < edges[0], 0, np.where(x > edges[-1], len(edges), indx))
+
+
+def stairs_window(edges, xmin, xmax):
+    """
+    Returns (i0, i1) such that segments i0 through i1-1 overlap the x-range
+    [xmin, xmax]. At least one segment is always returned.
+
+    """
+    nval = len(edges) - 1
+    i0 = int(_search_edges(edges, xmin, side='right')) - 1
+    i1 = int(_search_edges(edges, xmax, side='left'))
+    i0 = min(max(i0, 0), nval-1)
+    i1 = min(max(i1, i0+1), nval)
+    return i0, i1
+
+
+def stairs_vertices(edges, values):
+    """
+    Returns the (2*len(values), 2) array of vertices that trace the outline
+    of a stairs waveform, ready for a Line2D or LineCollection.
+
+    """
+    edges = np.asarray(edges).ravel()
+    values = np.asarray(values).ravel()
+    verts = np.empty((2*len(values), 2), dtype=float)
+    verts[:,0] = np.repeat(edges, 2)[1:-1]
+    verts[:,1] = np.repeat(values, 2)
+    return verts
+
+
+def stairs_stats(edges, values):
+    """
+    Returns a dict with the x-extent, value range, number of segments, area,
+    area of the squared values and a checksum of a stairs waveform. Meant to
+    be computed once when the data is read so that scaling and query code
+    never has to scan the arrays. Equal waveforms have equal 'hash' values.
+
+    """
+    edges = np.ascontiguousarray(edges).ravel()
+    values = np.ascontiguousarray(values).ravel()
+    stats = {'xmin' : edges[0].item(),
+             'xmax' : edges[-1].item(),
+             'ymin' : values.min().item(),
+             'ymax' : values.max().item(),
+             'nseg' : len(values),
+             'area' : float(np.dot(values, np.diff(edges))),
+             'area2': float(np.dot(np.square(values, dtype=float), np.diff(edges))),
+             'hash' : zlib.crc32(values, zlib.crc32(edges))}
+    return stats
+
+
+def resample_stairs(edges, values, grid, fill=0):
+    """
+    Returns the values of a stairs waveform on the segments of a new sorted
+    edge grid that includes all of its own edges (eg. a union grid). Grid
+    segments outside the waveform get the fill value.
+
+    """
+    edges = np.asarray(edges).ravel()
+    values = np.asarray(values).ravel()
+    indx = np.searchsorted(edges, grid[:-1], side='right') - 1
+    inside = (indx >= 0) & (indx < len(values))
+    out = np.full(len(grid)-1, fill, dtype=np.result_type(values, fill))
+    out[inside] = values[indx[inside]]
+    return out
+
+
+def merge_stairs(edges, values):
+    """ Returns (edges, values) with runs of equal neighbouring values joined """
+    edges = np.asarray(edges).ravel()
+    values = np.asarray(values).ravel()
+    keep = np.ones(len(values), dtype=bool)
+    keep[1:] = values[1:] != values[:-1]
+    return np.append(edges[:-1][keep], edges[-1]), values[keep]
+
+
+def union_edges(edges1, edges2):
+    """
+    Returns the sorted union of two sorted edge arrays. A stable sort of the
+    two concatenated runs is a merge, much quicker than np.union1d() here.
+
+    """
+    grid = np.concatenate((np.asarray(edges1).ravel(), np.asarray(edges2).ravel()))
+    grid.sort(kind='stable')
+    keep = np.ones(len(grid), dtype=bool)
+    keep[1:] = grid[1:] != grid[:-1]
+    return grid[keep]
+
+
+def stairs_difference(edges1, values1, edges2, values2):
+    """
+    Returns (edges, values) of waveform 1 minus waveform 2. Both waveforms
+    are resampled onto the union of their edges, and are taken as zero
+    outside their own extent. Equal neighbouring differences are merged.
+
+    """
+    edges1 = np.asarray(edges1).ravel()
+    edges2 = np.asarray(edges2).ravel()
+    if np.array_equal(edges1, edges2):
+        # same timing in both, the usual case between TRs
+        grid = edges1
+        diff = np.asarray(values1).ravel() - np.asarray(values2).ravel()
+    else:
+        grid = union_edges(edges1, edges2)
+        diff = resample_stairs(edges1, values1, grid) - resample_stairs(edges2, values2, grid)
+    return merge_stairs(grid, diff)
+
+
+def nonzero_ranges(edges, values):
+    """
+    Returns (starts, ends) arrays of the x-ranges where a stairs waveform
+    is not zero, with touching non-zero segments combined.
+
+    """
+    e, v = merge_stairs(edges, np.asarray(values).ravel() != 0)
+    return e[:-1][v], e[1:][v]
+
+
+def stairs_moments(edges, values, times, origin=0.0, norder=3):
+    """
+    Returns the cumulative moments M_n(t) = integral of v(x)*(x-origin)**n
+    from origin up to each of the x locations in times, for n = 0 up to
+    norder-1, as an array of shape (norder, len(times)).
+
+    Each segment adds v*(b**(n+1) - a**(n+1))/(n+1) in closed form, with a
+    and b its ends relative to origin, so the whole waveform is a few
+    cumulative sums. A segment cut by one of the times counts only for the
+    part before it. The waveform is taken as zero outside its edges and
+    segments before origin are ignored.
+
+    """
+    edges = np.asarray(edges, dtype=float).ravel() - origin
+    values = np.asarray(values, dtype=float).ravel()
+    times = np.atleast_1d(np.asarray(times, dtype=float)) - origin
+
+    e = np.clip(edges, 0.0, None)
+    k = np.clip(np.searchsorted(e, times, side='right') - 1, 0, len(values)-1)
+    x = np.clip(times, e[0], e[-1])
+
+    moments = np.empty((norder, len(times)), dtype=float)
+    for n in range(norder):
+        p = e**(n+1)
+        cum = np.concatenate(([0.0], np.cumsum(values*np.diff(p))))
+        partial = values[k]*(x**(n+1) - p[k])
+        moments[n] = (cum[k] + np.where(x > e[k], partial, 0.0)) / (n+1)
+
+    return moments
+
+
+def stairs_slew(edges, values, sample=1.0):
+    """
+    Returns (times, slew) for every inner edge of a stairs waveform, where
+    slew is the magnitude of the value jump at that edge over the time it
+    takes. A jump with no jump of the same sign next to it is a step between
+    held values and takes one sample. Runs of same sign jumps are ramps
+    written as steps, so each jump in a run takes the narrowest tread of the
+    ramp next to it (but at least one sample). A hard step inside a ramp of
+    short treads is still rated steep, a ramp of wide treads is not.
+
+    """
+    edges = np.asarray(edges, dtype=float).ravel()
+    values = np.asarray(values, dtype=float).ravel()
+    jump = np.diff(values)
+    width = np.diff(edges)
+    sign = np.sign(jump)
+    ramp = (sign[1:] == sign[:-1]) & (sign[1:] != 0)        # jumps i and i+1 are in one run
+
+    duration = np.full(len(jump), np.inf)
+    duration[1:] = np.where(ramp, width[1:-1], np.inf)                      # tread before
+    duration[:-1] = np.minimum(duration[:-1], np.where(ramp, width[1:-1], np.inf))  # tread after
+    duration = np.where(np.isinf(duration), sample, np.maximum(duration, sample))
+    return edges[1:-1], np.abs(jump)/duration
+
+
+def stairs_energy(edges, values, gate=None):
+    """
+    Returns (energy, on_time, peak) of a stairs waveform, that is the sum of
+    value**2*width, the total width of the non-zero segments and the largest
+    magnitude. If gate is an (edges, values) tuple of a second waveform, only
+    the parts where the gate is non-zero are counted.
+
+    """
+    edges = np.asarray(edges, dtype=float).ravel()
+    values = np.asarray(values, dtype=float).ravel()
+    if gate is not None:
+        gate_edges = np.asarray(gate[0], dtype=float).ravel()
+        grid = union_edges(edges, gate_edges)
+        values = resample_stairs(edges, values, grid) * (resample_stairs(gate_edges, gate[1], grid) != 0)
+        edges = grid
+
+    width = np.diff(edges)
+    energy = np.dot(values*values, width)
+    on_time = width[values != 0].sum()
+    peak = np.abs(values).max() if len(values) else 0.0
+    return float(energy), float(on_time), float(peak)
+
+
+def stairs_index(edges, x):
+    """
+    Returns the index of the segment that holds x, by binary search. Values
+    of x outside the edges are clipped to the first or last segment.
+
+    """
+    indx = int(np.searchsorted(edges, x, side='left')) - 1
+    return min(max(indx, 0), len(edges)-2)
+
+
+# compressors for stairs_pack(), the code is the first byte of a packed blob
+PACK_METHODS = {'zlib' : (1, zlib.compress,  zlib.decompress),
+                'lzma' : (2, lzma.compress,  lzma.decompress)}
+
+# counts, flag for delta coded edges, then the stored and original dtypes of
+# edges, run values and run lengths
+_PACK_HEADER = struct.Struct('<qqB3s3s3s3s3s')
+
+
+def _narrow(a):
+    """ integer array a cast to the smallest integer dtype that holds it """
+    if a.dtype.kind not in 'iu' or len(a) == 0:
+        return a
+    return a.astype(np.promote_types(np.min_scalar_type(a.min()), np.min_scalar_type(a.max())))
+
+
+def stairs_pack(edges, values, method='zlib'):
+    """
+    Returns a stairs waveform as compressed bytes, see stairs_unpack(). Integer
+    edges are stored as the first edge and the segment widths, and values as
+    runs of (value, count), each in the smallest integer type that fits. On
+    stairs data the widths repeat a lot, so method 'zlib' or 'lzma' then
+    does very well on what is left.
+
+    """
+    edges = np.asarray(edges).ravel()
+    values = np.asarray(values).ravel()
+
+    delta = edges.dtype.kind in 'iu'
+    stored = _narrow(np.diff(edges, prepend=0)) if delta else edges
+
+    starts = np.flatnonzero(np.diff(values) != 0) + 1
+    starts = np.concatenate(([0], starts)) if len(values) else starts
+    runs = _narrow(np.diff(np.append(starts, len(values))))
+    run_values = _narrow(values[starts])
+
+    header = _PACK_HEADER.pack(len(edges), len(starts), delta,
+                               stored.dtype.str.encode(), edges.dtype.str.encode(),
+                               run_values.dtype.str.encode(), values.dtype.str.encode(),
+                               runs.dtype.str.encode())
+    code, compress, _ = PACK_METHODS[method]
+    payload = header + stored.tobytes() + run_values.tobytes() + runs.tobytes()
+    return bytes([code]) + compress(payload)
+
+
+def stairs_unpack(blob):
+    """ returns the (edges, values) arrays of a blob made by stairs_pack() """
+    decompress = [item[2] for item in PACK_METHODS.values() if item[0] == blob[0]][0]
+    payload = decompress(blob[1:])
+
+    nedges, nruns, delta, stored_type, edges_type, run_type, values_type, runs_type = \
+        _PACK_HEADER.unpack_from(payload)
+    offset = _PACK_HEADER.size
+    arrays = []
+    for dtype, count in ((stored_type, nedges), (run_type, nruns), (runs_type, nruns)):
+        dtype = np.dtype(dtype.decode())
+        arrays.append(np.frombuffer(payload, dtype=dtype, count=count, offset=offset))
+        offset += dtype.itemsize*count
+    stored, run_values, runs = arrays
+
+    edges_type = np.dtype(edges_type.decode())
+    edges = np.cumsum(stored, dtype=edges_type) if delta else stored.astype(edges_type)
+    values = np.repeat(run_values.astype(values_type.decode()), runs)
+    return edges, values
+
+
+def stairs_delta(ref_edges, ref_values, edges, values):
+    """
+    Returns the changes from a reference stairs waveform to another one with
+    the same number of segments, as (edge indices, new edges, value indices,
+    new values), or None if the segment counts differ. Indices are stored in
+    the smallest integer type that fits, see stairs_undelta().
+
+    """
+    ref_edges, ref_values = np.asarray(ref_edges).ravel(), np.asarray(ref_values).ravel()
+    edges, values = np.asarray(edges).ravel(), np.asarray(values).ravel()
+    if len(edges) != len(ref_edges) or len(values) != len(ref_values):
+        return None
+    eindx = np.flatnonzero(edges != ref_edges)
+    vindx = np.flatnonzero(values != ref_values)
+    return _narrow(eindx), edges[eindx], _narrow(vindx), values[vindx]
+
+
+def stairs_undelta(ref_edges, ref_values, delta):
+    """ returns new (edges, values) arrays, ref with a stairs_delta() applied """
+    eindx, new_edges, vindx, new_values = delta
+    edges = np.array(ref_edges).ravel()
+    values = np.array(ref_values).ravel()
+    edges[eindx] = new_edges
+    values[vindx] = new_values
+    return edges, values
+
+
+
+class StairsIntegrals(object):
+    """
+    Prefix sums of value*width and value**2*width over a stairs waveform,
+    so the area, mean and RMS between any two x locations take a couple of
+    binary searches instead of a pass over the segments. Segments cut by
+    either end are counted for exactly the part inside. The waveform is
+    taken as zero outside its edges.
+
+    """
+
+    def __init__(self, edges, values):
+
+        self.edges  = np.asarray(edges, dtype=float).ravel()
+        values = np.asarray(values, dtype=float).ravel()
+        self.values = values
+
+        width = np.diff(self.edges)
+        self.sum1 = np.concatenate(([0.0], np.cumsum(values*width)))
+        self.sum2 = np.concatenate(([0.0], np.cumsum(values*values*width)))
+
+    def _at(self, x):
+        """ running integrals of value and value**2 from edges[0] up to x """
+        e = self.edges
+        if x <= e[0]:
+            return 0.0, 0.0
+        if x >= e[-1]:
+            return self.sum1[-1], self.sum2[-1]
+        k = int(np.searchsorted(e, x, side='right')) - 1
+        v = self.values[k]
+        dx = x - e[k]
+        return self.sum1[k] + v*dx, self.sum2[k] + v*v*dx
+
+    def area(self, x0, x1):
+        """ returns (area, mean, rms) over [x0, x1] """
+        if x0 > x1: x0, x1 = x1, x0
+        a0, b0 = self._at(x0)
+        a1, b1 = self._at(x1)
+        area = a1 - a0
+        if x1 == x0:
+            return 0.0, 0.0, 0.0
+        return area, area/(x1-x0), np.sqrt(max(b1 - b0, 0.0)/(x1-x0))
+
+
+
+class StairsLookup(object):
+    """
+    Looks up the value at one x location in several stairs waveforms with a
+    single np.searchsorted() call.
+
+    All channels are shifted so their edges lie end to end on one increasing
+    axis. A query x is shifted the same way for each channel and the hits are
+    clipped back into the segment range of their own channel.
+
+    """
+
+    def __init__(self, channels):
+        """ channels is a list of (edges, values) tuples """
+        shifted, values = [], []
+        self.shift  = np.zeros(len(channels))
+        self.estart = np.zeros(len(channels), dtype=np.int64)
+        self.vstart = np.zeros(len(channels), dtype=np.int64)
+        self.nval   = np.zeros(len(channels), dtype=np.int64)
+
+        base, estart, vstart = 0.0, 0, 0
+        for k, (e, v) in enumerate(channels):
+            e = np.asarray(e, dtype=float).ravel()
+            v = np.asarray(v).ravel()
+            self.shift[k]  = base - e[0]
+            self.estart[k] = estart
+            self.vstart[k] = vstart
+            self.nval[k]   = len(v)
+            shifted.append(e + self.shift[k])
+            values.append(v)
+            base   += (e[-1] - e[0]) + 1.0
+            estart += len(e)
+            vstart += len(v)
+
+        self.edges  = np.concatenate(shifted)
+        self.values = np.concatenate(values)
+
+    def values_at(self, x):
+        """ returns an array with the value of every channel at x """
+        indx = np.searchsorted(self.edges, x + self.shift, side='left') - 1 - self.estart
+        indx = np.clip(indx, 0, self.nval-1)
+        return self.values[self.vstart + indx]
+
+
+
+class RangeMinMax(object):
+    """
+    Answers min/max queries over any run of values[i0:i1] without scanning
+    the run, for channels with millions of segments.
+
+    Values are grouped into blocks of 'block' items. A sparse table holds
+    the min and max of every run of 2**k whole blocks, so the whole blocks
+    inside a query are covered by two overlapping table lookups. Only the
+    partial blocks at either end, at most 2*block items, are looked at
+    directly. The table costs about 2*log2(n/block) floats per block.
+
+    """
+
+    def __init__(self, values, block=64):
+
+        values = np.asarray(values).ravel()
+        self.values = values
+        self.block  = block
+
+        nblk = len(values) // block
+        blocks = values[:nblk*block].reshape(nblk, block)
+
+        self.tmin = [blocks.min(axis=1)] if nblk else []
+        self.tmax = [blocks.max(axis=1)] if nblk else []
+        k = 1
+        while (1 << k) <= nblk:
+            h = 1 << (k-1)
+            self.tmin.append(np.minimum(self.tmin[-1][:-h], self.tmin[-1][h:]))
+            self.tmax.append(np.maximum(self.tmax[-1][:-h], self.tmax[-1][h:]))
+            k += 1
+
+    def query(self, i0, i1):
+        """ returns (min, max) of values[i0:i1], i1 > i0 """
+        i0, i1 = int(i0), int(i1)
+        block = self.block
+        b0 = -(-i0 // block)                        # first whole block
+        b1 = min(i1 // block, len(self.tmin[0]) if self.tmin else 0)
+        if b1 <= b0:
+            run = self.values[i0:i1]
+            return run.min(), run.max()
+
+        k = (b1 - b0).bit_length() - 1
+        vmin = min(self.tmin[k][b0], self.tmin[k][b1-(1 << k)])
+        vmax = max(self.tmax[k][b0], self.tmax[k][b1-(1 << k)])
+        for run in (self.values[i0:b0*block], self.values[b1*block:i1]):
+            if len(run):
+                vmin = min(vmin, run.min())
+                vmax = max(vmax, run.max())
+        return vmin, vmax
+
+    def window(self, edges, xmin, xmax):
+        """ returns (min, max) of the segments that overlap [xmin, xmax] """
+        return self.query(*stairs_window(np.asarray(edges).ravel(), xmin, xmax))
+
+
+
+class StairsPyramid(object):
+    """
+    Min/max pyramid over one stairs waveform for fast rendering at any zoom.
+
+    Level L groups the segments into blocks of block**L. Each level keeps
+    the first edge, min and max of every block, and is built from the level
+    below it only the first time a render needs it. A render uses the
+    coarsest level that still has at least 4 blocks per output bin for the
+    middle of each bin, and finer levels down to single segments for the
+    ends, so the result is the same as decimate_stairs() and its cost
+    depends on the screen width and not on the number of segments.
+
+    """
+
+    def __init__(self, edges, values, block=8):
+
+        self.edges  = np.asarray(edges).ravel()
+        self.values = np.asarray(values).ravel()
+        self.block  = block
+
+        # level 0 is the waveform itself
+        self._levels = [(self.edges, self.values, self.values)]
+
+    def _level(self, n):
+        while len(self._levels) <= n:
+            e, vmin, vmax = self._levels[-1]
+            nval = len(vmin)
+            starts = np.arange(0, nval, self.block)
+            e = np.append(e[starts], e[-1])
+            self._levels.append((e, np.minimum.reduceat(vmin, starts), np.maximum.reduceat(vmax, starts)))
+        return self._levels[n]
+
+    def render(self, xmin, xmax, nbins):
+        """ returns decimated (edges, values) for [xmin, xmax] at nbins """
+        i0, i1 = stairs_window(self.edges, xmin, xmax)
+        nseg = i1 - i0
+
+        nbins = max(int(nbins), 1)
+
+        level = 0
+        while nseg // self.block**(level+1) >= 4*nbins:
+            level += 1
+        if level == 0:
+            return decimate_stairs(self.edges, self.values, nbins, xmin, xmax)
+        self._level(level)
+
+        # segments [a, b) overlap each bin, the same ones decimate_stairs() uses
+        xmin, xmax = max(xmin, self.edges[0]), min(xmax, self.edges[-1])
+        bounds = np.linspace(xmin, xmax, nbins+1)
+        a = np.clip(_search_edges(self.edges, bounds[:-1], side='right') - 1, i0, i1-1)
+        b = np.append(a[1:] + (self.edges[a[1:]] < bounds[1:-1]), i1)
+
+        vmin, vmax = self._extremes(a, b, level)
+        return _envelope_steps(bounds, vmin, vmax)
+
+    def _extremes(self, a, b, level):
+        """
+        Returns the min and max of segments [a, b) for each pair of indices.
+        Whole blocks of the given level cover the middle of each range, the
+        ends are made of ever smaller blocks, at most block-1 per level.
+
+        """
+        dtype = self.values.dtype
+        if dtype.kind in 'iu':
+            vmin = np.full(len(a), np.iinfo(dtype).max, dtype=dtype)
+            vmax = np.full(len(a), np.iinfo(dtype).min, dtype=dtype)
+        else:
+            vmin = np.full(len(a), np.inf, dtype=dtype)
+            vmax = np.full(len(a), -np.inf, dtype=dtype)
+
+        lo, hi = a, b
+        for n in range(level+1):
+            e, lower, upper = self._levels[n]
+            if n == level:
+                pieces = [(lo, hi)]
+            else:
+                lo_up = np.minimum(-(-lo//self.block)*self.block, hi)
+                hi_dn = np.maximum(hi//self.block*self.block, lo_up)
+                pieces = [(lo, lo_up), (hi_dn, hi)]
+            for start, end in pieces:
+                _fold_ranges(lower, upper, start, end, vmin, vmax)
+            if n < level:
+                lo, hi = lo_up//self.block, hi_dn//self.block
+
+        return vmin, vmax
+
+
+
+def _fold_ranges(lower, upper, start, end, vmin, vmax):
+    """ folds min(lower) and max(upper) over each non-empty [start, end) into vmin, vmax """
+    keep = start < end
+    if not keep.any():
+        return
+    start, end = start[keep], end[keep]
+
+    # gather the entries of all ranges into one array, so reduceat only
+    # visits them and not the gaps in between
+    lengths = end - start
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    gather = np.arange(lengths.sum()) - np.repeat(offsets - start, lengths)
+    rmin = np.minimum.reduceat(lower[gather], offsets)
+    rmax = np.maximum.reduceat(upper[gather], offsets)
+
+    vmin[keep] = np.minimum(vmin[keep], rmin)
+    vmax[keep] = np.maximum(vmax[keep], rmax)
+
+
+
+class StairsTimeline(object):
+    """
+    One virtual stairs waveform made by laying many stairs waveforms (eg. the
+    same channel of consecutive nodes) end to end, without concatenating them.
+
+    Part k is placed at x + shifts[k]. Any gaps between parts read as zero.
+    Only the per-part stats are needed up front. They make the coarsest
+    layer, a min/max step per part, that draws the whole timeline. The part
+    arrays are asked for through fetch(k) -> (edges, values) only when the
+    view is zoomed in far enough to see inside parts, and each gets its own
+    StairsPyramid at that point. Areas over whole parts come from prefix
+    sums of the per-part 'area' and 'area2' stats, only the parts cut by
+    the ends of a span are fetched. At most cache_parts pyramids and
+    integrals are kept, least recently used go first.
+
+    """
+
+    def __init__(self, stats, shifts, fetch, cache_parts=64):
+
+        self.fetch  = fetch
+        self.cache_parts = cache_parts
+        self.shifts = np.asarray(shifts, dtype=float)
+        self.starts = np.array([item['xmin'] for item in stats], dtype=float) + self.shifts
+        self.ends   = np.array([item['xmax'] for item in stats], dtype=float) + self.shifts
+        ymin = np.array([item['ymin'] for item in stats])
+        ymax = np.array([item['ymax'] for item in stats])
+
+        self._pyramids = collections.OrderedDict()
+        self._integrals = collections.OrderedDict()
+        self._sum1 = np.concatenate(([0.0], np.cumsum([item['area'] for item in stats])))
+        self._sum2 = np.concatenate(([0.0], np.cumsum([item['area2'] for item in stats])))
+
+        # coarse layer, min then max step over each part plus zero filled gaps
+        edges, values = [self.starts[0]], []
+        for k in range(len(stats)):
+            if self.starts[k] > edges[-1]:
+                edges.append(self.starts[k])
+                values.append(0)
+            edges += [0.5*(self.starts[k] + self.ends[k]), self.ends[k]]
+            values += [ymin[k], ymax[k]]
+        self.coarse_edges  = np.array(edges)
+        self.coarse_values = np.array(values)
+
+        self.stats = stairs_stats(self.coarse_edges, self.coarse_values)
+        self.stats['nseg'] = sum([item['nseg'] for item in stats])
+        self.stats['area'] = sum([item['area'] for item in stats])
+        self.stats['area2'] = float(self._sum2[-1])
+
+    def _cached(self, cache, k, make):
+        if k in cache:
+            cache.move_to_end(k)
+            return cache[k]
+        item = make(*self.fetch(k))
+        cache[k] = item
+        while len(cache) > self.cache_parts:
+            cache.popitem(last=False)
+        return item
+
+    def _pyramid(self, k):
+        return self._cached(self._pyramids, k, StairsPyramid)
+
+    def _parts(self, xmin, xmax):
+        k0 = max(int(np.searchsorted(self.ends, xmin, side='right')), 0)
+        k1 = int(np.searchsorted(self.starts, xmax, side='left'))
+        return k0, min(k1, len(self.starts))
+
+    def render(self, xmin, xmax, nbins):
+        """ returns decimated (edges, values) for [xmin, xmax] at nbins """
+        k0, k1 = self._parts(xmin, xmax)
+        if k1 - k0 > nbins // 4 or k1 <= k0:
+            # under 4 bins per part, the per part min/max steps are enough
+            return decimate_stairs(self.coarse_edges, self.coarse_values, nbins, xmin, xmax)
+
+        edges, values = [], []
+        for k in range(k0, k1):
+            lo = max(xmin, self.starts[k])
+            hi = min(xmax, self.ends[k])
+            nb = max(int(nbins*(hi-lo)/(xmax-xmin)), 1)
+            e, v = self._pyramid(k).render(lo-self.shifts[k], hi-self.shifts[k], nb)
+            e = e + self.shifts[k]
+            if edges:
+                if e[0] > edges[-1][-1]:
+                    values.append(np.zeros(1, dtype=v.dtype))
+                else:
+                    e = e[1:]
+            edges.append(e)
+            values.append(v)
+        return np.concatenate(edges), np.concatenate(values)
+
+    def value_at(self, x):
+        k = int(np.searchsorted(self.starts, x, side='right')) - 1
+        if k < 0 or x > self.ends[k]:
+            return 0
+        e, v = self.fetch(k)
+        return v[stairs_index(e, x - self.shifts[k])]
+
+    def area(self, x0, x1):
+        """ returns (area, mean, rms) over [x0, x1], see StairsIntegrals """
+        if x0 > x1: x0, x1 = x1, x0
+        if x1 == x0:
+            return 0.0, 0.0, 0.0
+        k0, k1 = self._parts(x0, x1)
+        sum1, sum2 = 0.0, 0.0
+        if k1 <= k0:
+            return 0.0, 0.0, 0.0
+
+        # whole parts from the prefix sums, parts cut by x0 or x1 in full
+        cut = [k for k in sorted(set([k0, k1-1])) if self.starts[k] < x0 or self.ends[k] > x1]
+        j0 = k0+1 if k0 in cut else k0
+        j1 = k1-1 if k1-1 in cut else k1
+        if j1 > j0:
+            sum1 += self._sum1[j1] - self._sum1[j0]
+            sum2 += self._sum2[j1] - self._sum2[j0]
+        for k in cut:
+            a, m, r = self._cached(self._integrals, k, StairsIntegrals).area(x0-self.shifts[k], x1-self.shifts[k])
+            sum1 += a
+            sum2 += r*r*(x1-x0)
+        return sum1, sum1/(x1-x0), np.sqrt(sum2/(x1-x0))
+
+    def range_minmax(self, xmin, xmax):
+        """ (min, max) of the timeline over [xmin, xmax], from a coarse render """
+        e, v = self.render(xmin, xmax, 64)
+        return v.min(), v.max()
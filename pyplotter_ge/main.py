@@ -13,11 +13,13 @@
 
 # Python modules
 import os
-import xml.etree.cElementTree as ElementTree
+import time
+import functools
 from multiprocessing import Pool, cpu_count
 
 # 3rd party modules
 import wx
+import numpy as np
 from wx.lib.embeddedimage import PyEmbeddedImage
 
 # Our modules
@@ -27,7 +29,12 @@ import pyplotter_ge.util_config_plotter_ge as util_config_pyplotter_ge
 import pyplotter_ge.auto_gui.pyplotter_ge as pyplotter_ge_gui
 
 from pyplotter_ge.plot_panel_plotter_ge import PlotPanelGePlotter
-from pyplotter_ge.util_plotter_ge import PlotterNode, PrefsGePlotter, util_create_menu_bar, is_intable
+from pyplotter_ge.util_prefetch_plotter_ge import NodePrefetcher
+from pyplotter_ge.util_memory_plotter_ge import WaveformMemory, MEMORY_COLUMNS, memory_rows
+from pyplotter_ge.util_analysis_plotter_ge import GRADIENT_CHANNELS, MOMENTS_COLUMNS, LIMITS_COLUMNS, RF_COLUMNS, node_extent, moments_job, moments_multiprocess, moments_rows, moment_curve, check_limits
+from pyplotter_ge.util_analysis_plotter_ge import read_node_rf_multiprocess, rf_windows, rf_rows
+from pyplotter_ge.util_plotter_ge import NodeCollection, PrefsGePlotter, util_create_menu_bar, find_node_files, node_nbytes
+from pyplotter_ge.common.util_stairs import stairs_difference, stairs_stats, nonzero_ranges, StairsTimeline
 
 
 
@@ -68,10 +75,19 @@ class PyPlotterGeMain(pyplotter_ge_gui.PyPlotterGeFrame):
 
         self.fname1 = ''
         self.nplots = 7
-        self.nodes = []
+        self.nodes = NodeCollection()
 
         self.node_number = 0
         self.first_scale_flag = True
+        self.playing = False
+        self.diff_nodes = None
+        self.diff_ranges = []
+        self.timeline = False
+        self.timeline_data = None
+        self.moment_curves = False
+        self.rf_window_energy = None
+        self.node_subset = None
+        self.last_query = ''
         self.show_flags = [False, False, False, False, False, False, False]
 
         # -----------------------------------------------------------
@@ -80,6 +96,23 @@ class PyPlotterGeMain(pyplotter_ge_gui.PyPlotterGeFrame):
         n_cpu = cpu_count()-1 if cpu_count() <= 8 else 7
         self.pool = Pool(n_cpu)
 
+        # -----------------------------------------------------------
+        # Waveform arrays of least recently viewed nodes are compressed and
+        # then dropped when over budget, and brought back when needed
+
+        self.memory = WaveformMemory(self.prefs.memory_budget_mb*1024*1024,
+                                     cold_bytes=self.prefs.memory_cold_mb*1024*1024,
+                                     method=self.prefs.memory_compress,
+                                     keyframes=self.prefs.memory_keyframes)
+
+        # -----------------------------------------------------------
+        # Background preparation of the nodes next to the one displayed
+
+        self.prefetcher = NodePrefetcher(self._node_data,
+                                         ahead=self.prefs.prefetch_ahead,
+                                         max_bytes=self.prefs.prefetch_memory_mb*1024*1024,
+                                         bitmaps=self.prefs.prefetch_bitmaps)
+
         # -----------------------------------------------------------
         # GUI Creation
 
@@ -93,6 +126,9 @@ class PyPlotterGeMain(pyplotter_ge_gui.PyPlotterGeFrame):
         if self.prefs.zero_line_plot_bottom: menu_items['&Bottom'].Check(True)
         if self.prefs.xaxis_show: menu_items['X-Axis - Show'].Check(True)
         if self.prefs.title_show: menu_items['Plot Title - Show'].Check(True)
+        if self.prefs.readout_all: menu_items['Readout - All Channels'].Check(True)
+        if self.prefs.crosshair: menu_items['Crosshair Cursor'].Check(True)
+        if self.prefs.autoy: menu_items['Auto Y-Scale'].Check(True)
 
         if self.prefs.show_gradx:
             menu_items['X-Grad'].Check(True)
@@ -118,12 +154,15 @@ class PyPlotterGeMain(pyplotter_ge_gui.PyPlotterGeFrame):
 
         self.menu_items = menu_items
 
-        self.statusbar = self.CreateStatusBar(4, 0)
+        self.statusbar = self.CreateStatusBar(5, 0)
         self.statusbar.SetStatusText('Select a folder with Plotter files.')
 
         self.plotting_enabled = False
         self.populate_controls()
         self.view.display_naxes(self.show_flags)
+        self.view.readout_all = self.prefs.readout_all
+        self.view.set_crosshair(self.prefs.crosshair)
+        self.view.autoy = self.prefs.autoy
         self.plotting_enabled = True
 
         self.bind_events()
@@ -134,6 +173,9 @@ class PyPlotterGeMain(pyplotter_ge_gui.PyPlotterGeFrame):
         self.Bind(wx.EVT_SIZE, self.on_self_coordinate_change)
         self.Bind(wx.EVT_MOVE, self.on_self_coordinate_change)
 
+        self.play_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.on_play_timer, self.play_timer)
+
 
     def on_cancel(self, event):
         self.on_self_close(event)
@@ -142,7 +184,11 @@ class PyPlotterGeMain(pyplotter_ge_gui.PyPlotterGeFrame):
     def on_self_close(self, event):
         # I trap this so I can save my coordinates
 
+        self.play_timer.Stop()
         self.pool.terminate()
+        self.prefetcher.stop()
+        self.memory.stop()
+        self.view.stop_async()
 
         config = util_config_pyplotter_ge.Config()
         config.set_window_coordinates("main", self._left, self._top, self._width, self._height)
@@ -162,6 +208,9 @@ class PyPlotterGeMain(pyplotter_ge_gui.PyPlotterGeFrame):
         config.set_main_pref('show_omega', str(self.prefs.show_omega))
         config.set_main_pref('xaxis_show', self.prefs.xaxis_show)
         config.set_main_pref('title_show', self.prefs.title_show)
+        config.set_main_pref('readout_all', str(self.prefs.readout_all))
+        config.set_main_pref('crosshair', str(self.prefs.crosshair))
+        config.set_main_pref('autoy', str(self.prefs.autoy))
         config.set_main_pref('data_type_summed', str(self.prefs.data_type_summed))
         config.set_main_pref('zero_line_plot_color', self.prefs.zero_line_plot_color)
         config.set_main_pref('zero_line_plot_style', self.prefs.zero_line_plot_style)
@@ -170,6 +219,16 @@ class PyPlotterGeMain(pyplotter_ge_gui.PyPlotterGeFrame):
         config.set_main_pref('line_color_magnitude', self.prefs.line_color_magnitude)
         config.set_main_pref('line_width', str(self.prefs.line_width))
         config.set_main_pref('plot_view', self.prefs.plot_view)
+        config.set_main_pref('prefetch_ahead', str(self.prefs.prefetch_ahead))
+        config.set_main_pref('prefetch_memory_mb', str(self.prefs.prefetch_memory_mb))
+        config.set_main_pref('prefetch_bitmaps', str(self.prefs.prefetch_bitmaps))
+        config.set_main_pref('async_render', str(self.prefs.async_render))
+        config.set_main_pref('rf_gate', self.prefs.rf_gate)
+        config.set_main_pref('rf_window', str(self.prefs.rf_window))
+        config.set_main_pref('memory_budget_mb', str(self.prefs.memory_budget_mb))
+        config.set_main_pref('memory_cold_mb', str(self.prefs.memory_cold_mb))
+        config.set_main_pref('memory_compress', self.prefs.memory_compress)
+        config.set_main_pref('memory_keyframes', str(self.prefs.memory_keyframes))
 
         config.write()
         self.Destroy()
@@ -255,26 +314,33 @@ class PyPlotterGeMain(pyplotter_ge_gui.PyPlotterGeFrame):
         if not fpath: return
         if not os.path.isdir(fpath): return
 
-        # Get all files in directory and sub-directories
-        # - remove any directories
-        # - only take files ending in ints e.g. 'file.xml.10', this removes 'ssp' files
-
-        fnames = []
-        for root, _, all_fnames in os.walk(fpath):
-            for fname in all_fnames:
-                fnames.append(os.path.join(root, fname))
-
-        fnames = [fname for fname in fnames if os.path.isfile(fname)]
-        fnames = [fname for fname in fnames if is_intable(fname.split('.')[-1])]
-
-        # we set up our Pool during __init__ call
-        items = self.pool.map(read_node_multiprocess, fnames)
-
-        self.nodes = [item for item in items if item is not None]       # failed reads return None
+        self.stop_playback()
+
+        # Get all node files in directory and sub-directories
+        fnames = find_node_files(fpath)
+
+        # we set up our Pool during __init__ call, the RF summary of each
+        # node is computed in the worker that reads it. Nodes past the
+        # memory budget are packed or unloaded, and with memory_keyframes
+        # stored as deltas, as they arrive in scan order.
+        reader = functools.partial(read_node_rf_multiprocess, gate=self.prefs.rf_gate)
+        self.memory.reset()
+        items = []
+        for item in self.pool.imap(reader, fnames, chunksize=8):
+            if item is not None:                                # failed reads return None
+                self.memory.admit(item)
+                items.append(item)
+        self.memory.admit_done()
+
+        self.nodes = NodeCollection(items)
         n_nodes = len(self.nodes)
 
-        self.nodes.sort(key=lambda x: x.id, reverse=False)
-        self.fnames = [item.fname for item in self.nodes]
+        self.nodes = self.nodes.sort('id')
+        self.fnames = self.nodes.fnames
+        self.prefetcher.reset(self.nodes)
+        self.timeline_data = None
+        self.rf_window_energy = rf_windows(self.nodes, self.prefs.rf_window) if self.nodes else None
+        self.node_subset = None
 
         titles = [item.title for item in self.nodes[0].sequencers]
 
@@ -300,6 +366,14 @@ class PyPlotterGeMain(pyplotter_ge_gui.PyPlotterGeFrame):
 
             path, _ = os.path.split(self.fnames[0])
             util_config_pyplotter_ge.set_path(sect, path)
+
+            energy = self.nodes.column('rf.energy').sum()
+            window_power = self.rf_window_energy.max()/self.prefs.rf_window
+            node = self.nodes[self.node_number]
+            node_kb = node_nbytes(node)/1024.0
+            saved_kb = node_nbytes(node, slotted=False)/1024.0 - node_kb
+            self.statusbar.SetStatusText(" %d nodes, %.1f KB/node (%.2f KB saved by slots), RF energy = %.4g, max window power = %.4g" % (n_nodes, node_kb, saved_kb, energy, window_power), 3)
+            self._update_memory_status()
         else:
             self.statusbar.SetStatusText('No plot nodes found - returning')
 
@@ -356,6 +430,24 @@ class PyPlotterGeMain(pyplotter_ge_gui.PyPlotterGeFrame):
         self.view.update_axes()
         self.view.canvas.draw()
 
+    def on_readout_all(self, event):
+        self.prefs.readout_all = not self.prefs.readout_all
+        self.view.readout_all = self.prefs.readout_all
+
+    def on_crosshair(self, event):
+        self.prefs.crosshair = not self.prefs.crosshair
+        self.view.set_crosshair(self.prefs.crosshair)
+
+    def on_zoom_back(self, event):
+        self.view.history_back()
+
+    def on_zoom_forward(self, event):
+        self.view.history_forward()
+
+    def on_autoy(self, event):
+        self.prefs.autoy = not self.prefs.autoy
+        self.view.set_autoy(self.prefs.autoy)
+
     def on_placeholder(self, event):
         print( "Event handler for on_placeholder - not implemented")
 
@@ -460,6 +552,203 @@ class PyPlotterGeMain(pyplotter_ge_gui.PyPlotterGeFrame):
         self.prefs.show_omega = not self.show_flags[indx]
         self.view.display_naxes(self.show_flags)
 
+    def on_overlay_nodes(self, event):
+        if not self.nodes: return
+
+        nodes = self._ask_node_range('Overlay Nodes', 'Node range to overlay (eg. 0-99 or 0-999:10)')
+        if not nodes: return
+
+        arrays = [self.memory.use(self.nodes[j])[:self.nplots] for j in nodes]
+        overlays = [[item[i] for item in arrays] for i in range(self.nplots)]
+
+        self.view.set_overlay(overlays)
+        self.view.canvas.draw()
+        self.statusbar.SetStatusText(" Overlay = %d nodes, %d to %d" % (len(nodes), nodes[0], nodes[-1]), 3)
+
+    def on_clear_overlay(self, event):
+        self.moment_curves = False
+        self.view.clear_overlay()
+        self.view.clear_curves()
+        self.view.canvas.draw()
+        self.statusbar.SetStatusText(" ", 3)
+
+    def on_gradient_moments(self, event):
+        if not self.nodes: return
+
+        nodes = self._ask_node_range('Gradient Moments', 'Node range for moments (eg. 0-99 or 0-999:10)')
+        if not nodes: return
+
+        xmin, xmax = node_extent(self.nodes[self.node_number])
+        default = '%d' % ((xmax - xmin)//2, )
+        dlg = wx.TextEntryDialog(self, 'Echo time, in data points after the start of each node', 'Gradient Moments', default)
+        result = dlg.ShowModal()
+        text = dlg.GetValue().strip()
+        dlg.Destroy()
+        if result != wx.ID_OK: return
+
+        try:
+            echo = float(text)
+        except ValueError:
+            self.statusbar.SetStatusText(" Bad echo time - '%s'" % (text, ), 3)
+            return
+
+        # closed form per segment in each worker, nodes spread over the pool,
+        # the workers read the nodes that are not in memory from their files
+        time1 = time.perf_counter()
+        jobs = []
+        for node in self.nodes.take(nodes):
+            jobs.append(moments_job(node, echo, arrays=self.memory.peek(node) or node.fname))
+        results = self.pool.map(moments_multiprocess, jobs)
+        elapsed = time.perf_counter() - time1
+
+        # the running M0 of the displayed node goes on top of its gradients
+        if not (self.timeline or self.diff_nodes):
+            self.moment_curves = True
+            self._show_moment_curves(self.nodes[self.node_number])
+            self.view.canvas.draw()
+
+        self.statusbar.SetStatusText(" Moments = %d nodes in %.2f sec" % (len(nodes), elapsed), 3)
+
+        rows = moments_rows(self.nodes.take(nodes), results)
+        common_dialogs.show_table(rows, MOMENTS_COLUMNS, title='Gradient Moments - echo at %g' % (echo, ), parent=self)
+
+    def on_check_limits(self, event):
+        if not self.nodes: return
+
+        nodes = self._ask_node_range('Check Gradient Limits', 'Node range to check (eg. 0-99 or 0-999:10)')
+        if not nodes: return
+
+        limits = util_config_pyplotter_ge.Config().get_gradient_limits()
+        if limits['amplitude'] <= 0 or limits['slew'] <= 0:
+            common_dialogs.message('Gradient limits are not set. Set amplitude and slew under\n'
+                                   '[gradient_limits] in the INI file for your scanner.', title='Check Gradient Limits')
+            return
+
+        time1 = time.perf_counter()
+        violations = check_limits(self.nodes.take(nodes), limits, pool=self.pool, peek=self.memory.peek)
+        elapsed = time.perf_counter() - time1
+
+        msg = " Limits = %d violations in %d nodes, %.2f sec" % (len(violations), len(nodes), elapsed)
+        self.statusbar.SetStatusText(msg, 3)
+        if not violations:
+            common_dialogs.message('No gradient amplitude or slew violations in %d nodes.\n\n'
+                                   'Amplitude limit = %g\nSlew limit = %g' % (len(nodes), limits['amplitude'], limits['slew']),
+                                   title='Check Gradient Limits')
+            return
+
+        title = 'Gradient Limits - amplitude %g, slew %g' % (limits['amplitude'], limits['slew'])
+        common_dialogs.show_table([list(item) for item in violations], LIMITS_COLUMNS, title=title, parent=self)
+
+    def on_rf_summary(self, event):
+        if not self.nodes: return
+
+        window = self.prefs.rf_window
+        energy = self.nodes.column('rf.energy').sum()
+        extent = self.nodes.column('rf.extent')
+        duty = np.dot(self.nodes.column('rf.duty'), extent)/extent.sum() if extent.sum() > 0 else 0.0
+        peak = self.nodes.column('rf.peak').max()
+        imax = int(np.argmax(self.rf_window_energy))
+
+        title = 'RF Energy - scan energy %.4g, duty cycle %.3f, peak %g, max window power %.4g at node %d' % \
+                (energy, duty, peak, self.rf_window_energy[imax]/window, self.nodes[imax].id)
+        rows = rf_rows(self.nodes, self.rf_window_energy, window)
+        common_dialogs.show_table(rows, RF_COLUMNS, title=title, parent=self)
+
+    def on_waveform_memory(self, event):
+        if not self.nodes: return
+
+        mb = 1024.0*1024.0
+        title = 'Waveform Memory - %.0f MB hot, %.1f MB cold, %.1f MB delta, %d decompressed, %d re-read' % \
+                (self.memory.nbytes/mb, self.memory.cold_nbytes/mb, self.memory.delta_nbytes/mb,
+                 self.memory.nthaw, self.memory.nreload)
+        common_dialogs.show_table(memory_rows(self.memory, self.nodes), MEMORY_COLUMNS, title=title, parent=self)
+
+    def on_find_nodes(self, event):
+        if not self.nodes: return
+
+        msg = 'Find nodes where, eg.  gradz.peak > 1000 and rho.nseg < 200  or  ssp.hash != ssp.hash[0]\n\n' \
+              'Channels: gradx grady gradz ssp rho theta omega\n' \
+              'Statistics: min max peak area nseg start end hash, node id is id'
+        dlg = wx.TextEntryDialog(self, msg, 'Find Nodes', self.last_query)
+        result = dlg.ShowModal()
+        text = dlg.GetValue().strip()
+        dlg.Destroy()
+        if result != wx.ID_OK or not text: return
+
+        try:
+            matches = self.nodes.query(text)
+        except ValueError as e:
+            self.statusbar.SetStatusText(" Find - %s" % (str(e), ), 3)
+            return
+
+        self.last_query = text
+        if len(matches) == 0:
+            self.statusbar.SetStatusText(" Find = no nodes match '%s'" % (text, ), 3)
+            return
+
+        self.stop_playback()
+        self.node_subset = matches
+        self.statusbar.SetStatusText(" Find = %d of %d nodes match '%s'" % (len(matches), len(self.nodes), text), 3)
+
+        # show the first match at or after the current node
+        k = min(int(np.searchsorted(matches, self.node_number)), len(matches)-1)
+        self.node_number = int(matches[k])
+        self.SpinNodeNumber.SetValue(self.node_number)
+        self.TextCurrentFile.SetLabelText(os.path.basename(self.fnames[self.node_number]))
+        self.plot()
+
+    def on_find_clear(self, event):
+        self.node_subset = None
+        self.statusbar.SetStatusText(" Find = all %d nodes" % (len(self.nodes), ), 3)
+
+    def on_timeline_view(self, event):
+        if not self.nodes:
+            self.menu_items['Timeline View'].Check(False)
+            return
+        if self.timeline:
+            self.plot()
+        else:
+            self.plot_timeline()
+
+    def on_difference_view(self, event):
+        if not self.nodes: return
+
+        n = self.node_number
+        default = '%d, %d' % (n, min(n+1, len(self.nodes)-1))
+        dlg = wx.TextEntryDialog(self, 'Two node numbers to subtract (eg. 10, 11)', 'Difference View', default)
+        result = dlg.ShowModal()
+        text = dlg.GetValue()
+        dlg.Destroy()
+        if result != wx.ID_OK: return
+
+        try:
+            a, b = [int(item) for item in text.replace(',', ' ').split()]
+        except ValueError:
+            self.statusbar.SetStatusText(" Bad node pair - '%s'" % (text, ), 3)
+            return
+        if not (0 <= a < len(self.nodes) and 0 <= b < len(self.nodes)):
+            self.statusbar.SetStatusText(" Bad node pair - nodes are 0 to %d" % (len(self.nodes)-1, ), 3)
+            return
+
+        self.plot_difference(a, b)
+
+    def on_difference_summary(self, event):
+        if self.diff_nodes is None:
+            common_dialogs.message('Use Tools > Difference View to select two nodes first.')
+            return
+
+        lines = ['Node %d - Node %d\n' % self.diff_nodes]
+        for i, (starts, ends) in enumerate(self.diff_ranges):
+            label = self.nodes[0].sequencers[i].channel
+            if len(starts) == 0:
+                lines.append('%s : identical' % (label, ))
+                continue
+            ranges = ['%d-%d' % (s, e) for s, e in zip(starts[:10], ends[:10])]
+            more = ', ... (%d more)' % (len(starts)-10, ) if len(starts) > 10 else ''
+            lines.append('%s : %d ranges differ - %s%s' % (label, len(starts), ', '.join(ranges), more))
+
+        common_dialogs.message('\n'.join(lines), title='Difference Summary')
+
     def on_user_manual(self, event):
         print('Not Implemented - User Manual')
 
@@ -468,14 +757,112 @@ class PyPlotterGeMain(pyplotter_ge_gui.PyPlotterGeFrame):
 
 
     def on_node_number(self, event):
-        self.node_number = event.GetEventObject().GetValue()
+        self.stop_playback()
+        n = event.GetEventObject().GetValue()
+        if self.node_subset is not None:
+            # step to the next match in the direction the spin moved
+            subset = self.node_subset
+            if n > self.node_number:
+                k = min(np.searchsorted(subset, n, side='left'), len(subset)-1)
+            else:
+                k = max(np.searchsorted(subset, n, side='right')-1, 0)
+            n = int(subset[k])
+            event.GetEventObject().SetValue(n)
+        self.node_number = n
         self.TextCurrentFile.SetLabelText(os.path.basename(self.fnames[self.node_number]))
         self.plot()
 
 
+    def on_play(self, event):
+        if self.ButtonPlay.GetValue():
+            self.start_playback()
+        else:
+            self.stop_playback()
+
+
+    def on_frame_rate(self, event):
+        if self.playing:
+            # restart the clock at the current node with the new rate
+            self._play_start = time.perf_counter()
+            self._play_first = self._play_index()
+            self.play_timer.Start(int(1000/self.SpinFrameRate.GetValue()))
+
+
+    def on_play_timer(self, event):
+        if not self.playing:
+            return
+
+        # The node shown is set by the clock, not by the number of frames
+        # drawn, so any frames we could not render in time are dropped.
+        fps = self.SpinFrameRate.GetValue()
+        now = time.perf_counter()
+        play_nodes = self._play_nodes()
+        n = int(play_nodes[(self._play_first + int((now - self._play_start) * fps)) % len(play_nodes)])
+        if n == self.node_number:
+            return
+
+        self.node_number = n
+        self.SpinNodeNumber.SetValue(n)
+        self.TextCurrentFile.SetLabelText(os.path.basename(self.fnames[n]))
+
+        entry = self.prefetcher.get(n)
+        data = entry['data'] if entry is not None else self._node_data(self.nodes[n])
+        self.view.animate_data(data)
+        self.prefetcher.notify(n)
+
+        self._play_frames += 1
+        if now - self._play_fps_start >= 1.0:
+            achieved = self._play_frames / (now - self._play_fps_start)
+            self.statusbar.SetStatusText(" Playback = %.1f fps (target %d)" % (achieved, fps), 1)
+            self._play_frames = 0
+            self._play_fps_start = now
+
+
     # -------------------------------------------------------------------------
     # Helper methods
 
+    def start_playback(self):
+        if self.playing:
+            return
+        if not self.nodes:
+            self.ButtonPlay.SetValue(False)
+            return
+
+        self.playing = True
+        self.ButtonPlay.SetLabel('Pause')
+        self.view.start_animation()
+
+        now = time.perf_counter()
+        self._play_start = now
+        self._play_first = self._play_index()
+        self._play_frames = 0
+        self._play_fps_start = now
+        self.play_timer.Start(int(1000/self.SpinFrameRate.GetValue()))
+
+
+    def _play_nodes(self):
+        """ node indices that playback steps through, the Find subset if any """
+        if self.node_subset is not None:
+            return self.node_subset
+        return range(len(self.nodes))
+
+    def _play_index(self):
+        """ position of the current node in _play_nodes() """
+        if self.node_subset is not None:
+            return min(int(np.searchsorted(self.node_subset, self.node_number)), len(self.node_subset)-1)
+        return self.node_number
+
+
+    def stop_playback(self):
+        if not self.playing:
+            return
+
+        self.playing = False
+        self.play_timer.Stop()
+        self.ButtonPlay.SetValue(False)
+        self.ButtonPlay.SetLabel('Play')
+        self.view.stop_animation()
+
     def plot(self, is_replot=False, initialize=False):
 
         if not self.plotting_enabled:
@@ -484,18 +871,213 @@ class PyPlotterGeMain(pyplotter_ge_gui.PyPlotterGeFrame):
         if self.nodes is None:
             return
 
+        self.diff_nodes = None
+        if self.timeline:
+            self.timeline = False
+            self.menu_items['Timeline View'].Check(False)
+            self.first_scale_flag = True
         n = self.node_number
 
-        data = [{'edges': self.nodes[n].sequencers[i].edges,
-                 'values': self.nodes[n].sequencers[i].values,
-                 'line_color_real': 'black' } for i in range(self.nplots)]
+        entry = self.prefetcher.get(n)
+        if entry is not None:
+            data = entry['data']
+        else:
+            data = self._node_data(self.nodes[n])
 
         self.view.set_data(data)
         self.view.update(no_draw=True, set_scale=self.first_scale_flag)
-        self.view.canvas.draw()
+        if self.moment_curves:
+            self._show_moment_curves(self.nodes[n])
+
+        # a prefetched render of this node at the current view goes up on
+        # screen right away, the real draw happens when events quiet down or,
+        # with async_render, when the user next clicks in the plot
+        shown = False
+        if entry is not None and entry['bitmap'] is not None:
+            if entry['key'] == self.view.view_key():
+                shown = self.view.show_bitmap(*entry['bitmap'])
+        if shown:
+            if not self.prefs.async_render:
+                self.view.canvas.draw_idle()
+        elif self.prefs.async_render:
+            self.view.draw_async()
+        else:
+            self.view.canvas.draw()
 
         if self.first_scale_flag: self.first_scale_flag = False
 
+        self._update_prefetch()
+        self._update_memory_status()
+
+
+    def plot_difference(self, a, b):
+        """
+        Shows node a minus node b for every channel in place of the current
+        node. Channels are differenced on the union of their edges, see
+        util_stairs.stairs_difference(). Stepping to another node returns
+        to the normal view.
+
+        """
+        self.stop_playback()
+
+        data = []
+        self.diff_ranges = []
+        arrays1 = self.memory.use(self.nodes[a])
+        arrays2 = self.memory.use(self.nodes[b])
+        for i in range(self.nplots):
+            e, v = stairs_difference(arrays1[i][0], arrays1[i][1], arrays2[i][0], arrays2[i][1])
+            data.append({'edges': np.atleast_2d(e),
+                         'values': np.atleast_2d(v),
+                         'stats': stairs_stats(e, v),
+                         'line_color_real': 'red' })
+            self.diff_ranges.append(nonzero_ranges(e, v))
+
+        self.diff_nodes = (a, b)
+        self.timeline = False
+        self.view.clear_curves()
+        self.menu_items['Timeline View'].Check(False)
+        self.view.set_data(data)
+        self.view.update(no_draw=True, set_scale=True)
+        self.view.canvas.draw()
+
+        # differences have their own scale, so rescale on return to nodes
+        self.first_scale_flag = True
+
+        ndiff = len([item for item in self.diff_ranges if len(item[0])])
+        self.statusbar.SetStatusText(" Difference = node %d - node %d, %d channels differ" % (a, b, ndiff), 3)
+
+
+    def plot_timeline(self):
+        """
+        Shows all nodes laid end to end as one continuous waveform per
+        channel. Each node is placed right after the previous one using its
+        x-extent. The begin_time attribute is free text in the Plotter
+        files, so it is not used for this. Node arrays are only looked at
+        when the view is zoomed in on them, see util_stairs.StairsTimeline.
+        Stepping to another node returns to the normal view.
+
+        """
+        self.stop_playback()
+
+        if self.timeline_data is None:
+            nodes = self.nodes
+            nodes_xmin, nodes_xmax = nodes.extents()
+            extents = nodes_xmax - nodes_xmin
+            shifts = np.concatenate(([0], np.cumsum(extents)[:-1])) - nodes_xmin
+
+            self.timeline_data = []
+            for i in range(self.nplots):
+                fetch = lambda k, i=i: self._sequencer_arrays(nodes[k], i)
+                source = StairsTimeline([node.sequencers[i].stats for node in nodes], shifts, fetch)
+                self.timeline_data.append({'edges': np.atleast_2d(source.coarse_edges),
+                                           'values': np.atleast_2d(source.coarse_values),
+                                           'stats': source.stats,
+                                           'source': source,
+                                           'line_color_real': 'black' })
+
+        self.timeline = True
+        self.menu_items['Timeline View'].Check(True)
+        self.view.clear_curves()
+        self.view.set_data(self.timeline_data)
+        self.view.update(no_draw=True, set_scale=True)
+        self.view.canvas.draw()
+
+        # the timeline has its own x-range, so rescale on return to nodes
+        self.first_scale_flag = True
+
+        nseg = sum([item['stats']['nseg'] for item in self.timeline_data])
+        self.statusbar.SetStatusText(" Timeline = %d nodes, %d segments" % (len(self.nodes), nseg), 3)
+
+
+    def _show_moment_curves(self, node):
+        """
+        Puts the running M0 of each gradient channel of node on top of its
+        plot. M0 has other units than the gradient, so each curve is scaled
+        to peak at the largest magnitude of its channel.
+
+        """
+        curves = [None for item in range(self.nplots)]
+        arrays = self.memory.use(node)
+        for i in GRADIENT_CHANNELS:
+            seq = node.sequencers[i]
+            x, m0 = moment_curve(*arrays[i])
+            peak = np.abs(m0).max()
+            ymax = max(abs(seq.stats['ymin']), abs(seq.stats['ymax']))
+            scale = ymax/peak if peak > 0 else 1.0
+            curves[i] = (x, m0*scale)
+        self.view.set_curves(curves)
+
+
+    def _ask_node_range(self, title, msg):
+        """
+        Asks for a range of node numbers as 'first-last' or 'first-last:step'
+        and returns it as a list of indices into self.nodes, or [] on cancel
+        or a bad entry.
+
+        """
+        default = '0-%d' % (len(self.nodes)-1, )
+        dlg = wx.TextEntryDialog(self, msg, title, default)
+        result = dlg.ShowModal()
+        text = dlg.GetValue().strip()
+        dlg.Destroy()
+        if result != wx.ID_OK:
+            return []
+
+        try:
+            step = 1
+            if ':' in text:
+                text, step = text.split(':')
+                step = max(int(step), 1)
+            first, last = [int(item) for item in text.split('-')]
+        except ValueError:
+            self.statusbar.SetStatusText(" Bad node range - '%s'" % (text, ), 3)
+            return []
+
+        first = min(max(first, 0), len(self.nodes)-1)
+        last  = min(max(last, first), len(self.nodes)-1)
+        return list(range(first, last+1, step))
+
+
+    def _node_data(self, node):
+        """
+        Returns the list of plot data dicts for one node. The 2D views keep
+        PlotPanelStairs.set_data() from reshaping the node's own arrays, this
+        is also called from the prefetch thread.
+
+        """
+        arrays = self.memory.use(node)
+        data = [{'edges': np.atleast_2d(arrays[i][0]),
+                 'values': np.atleast_2d(arrays[i][1]),
+                 'stats': node.sequencers[i].stats,
+                 'line_color_real': 'black' } for i in range(self.nplots)]
+        return data
+
+
+    def _sequencer_arrays(self, node, i):
+        """ (edges, values) of sequencer i of node, read back in if unloaded """
+        return self.memory.use(node)[i]
+
+
+    def _update_memory_status(self):
+        mb = 1024.0*1024.0
+        msg = " Waveforms = %.0f of %.0f MB, %d hot, %d cold %.1f MB, %d delta %.1f MB, of %d nodes" % \
+              (self.memory.nbytes/mb, self.memory.max_bytes/mb, self.memory.nloaded,
+               self.memory.ncold, self.memory.cold_nbytes/mb,
+               self.memory.ndelta, self.memory.delta_nbytes/mb, len(self.nodes))
+        self.statusbar.SetStatusText(msg, 4)
+
+
+    def _update_prefetch(self):
+        """ point the prefetcher at the current node and view """
+        npix = max(int(self.view.axes[0].bbox.width), 1)
+        if self.prefs.prefetch_bitmaps:
+            key = self.view.view_key()
+            if key != self.prefetcher.template_key:
+                self.prefetcher.set_view(npix, self.view.figure_template(), key)
+        else:
+            self.prefetcher.set_view(npix)
+        self.prefetcher.notify(self.node_number)
+
 
     def menu_data(self):
         r = [("&File", (
@@ -513,6 +1095,12 @@ class PyPlotterGeMain(pyplotter_ge_gui.PyPlotterGeFrame):
                 ("", "", ""),
                 ("X-Axis - Show", "", self.on_xaxis_show,       wx.ITEM_CHECK, None),
                 ("Plot Title - Show", "", self.on_title_show,   wx.ITEM_CHECK, None),
+                ("Readout - All Channels", "", self.on_readout_all, wx.ITEM_CHECK, None),
+                ("Crosshair Cursor", "", self.on_crosshair,     wx.ITEM_CHECK, None),
+                ("Auto Y-Scale",     "", self.on_autoy,         wx.ITEM_CHECK, None),
+                ("", "", ""),
+                ("Zoom Back\tAlt+Left",     "", self.on_zoom_back),
+                ("Zoom Forward\tAlt+Right", "", self.on_zoom_forward),
                 ("", "", ""),
                 ("Show All",       "", self.on_show_all),
                 ("Show Gradients", "", self.on_show_grad),
@@ -528,6 +1116,23 @@ class PyPlotterGeMain(pyplotter_ge_gui.PyPlotterGeFrame):
                 ("", "", ""),
                 ("&Placeholder",    "non-event",  self.on_placeholder)
             )),
+            ("Tools", (
+                ("Overlay Nodes...", "", self.on_overlay_nodes),
+                ("Clear Overlay",    "", self.on_clear_overlay),
+                ("", "", ""),
+                ("Gradient Moments...", "", self.on_gradient_moments),
+                ("Check Gradient Limits...", "", self.on_check_limits),
+                ("RF Energy Summary",        "", self.on_rf_summary),
+                ("Waveform Memory",          "", self.on_waveform_memory),
+                ("", "", ""),
+                ("Find Nodes...",  "", self.on_find_nodes),
+                ("Show All Nodes", "", self.on_find_clear),
+                ("", "", ""),
+                ("Difference View...",  "", self.on_difference_view),
+                ("Difference Summary",  "", self.on_difference_summary),
+                ("", "", ""),
+                ("Timeline View",       "", self.on_timeline_view, wx.ITEM_CHECK, None),
+            )),
             ("Help", (
                 ("User Manual", "", self.on_user_manual),
                 ("", "", ""),
@@ -537,28 +1142,6 @@ class PyPlotterGeMain(pyplotter_ge_gui.PyPlotterGeFrame):
         return r
 
 
-def read_node_multiprocess(fname):
-    """ This has to be outside the main object to be used in a Pool """
-    try:
-        with open(fname, 'rb') as f:
-            tree = ElementTree.ElementTree(file=f)
-
-        if tree:
-            if tree.getroot().tag == 'PulseSequence':
-                node = PlotterNode(attributes=tree)
-                node.id = int(fname.split('.')[-1])
-                node.fname = fname
-                return node
-            else:
-                return None
-        else:
-            return None
-
-    except Exception as e:
-        return None
-
-
-
 # ------------------------------------------------------------------------------
 
 def main():
@@ -36,13 +36,34 @@ class PlotPanelGePlotter(PlotPanelStairs):
     
     def on_motion(self, xdata, ydata, val, bounds, iaxis):
         
-        value = 0.0
-        if iaxis in list(range(self.naxes)):
-            value = val
-            
-        self.top.statusbar.SetStatusText( " Xvalue [int] = %d" % (xdata, ), 0)
-        self.top.statusbar.SetStatusText( " ", 1)
-        self.top.statusbar.SetStatusText( " Value = "+str(value), 2)
+        if self.readout_all or self.crosshair:
+            items = []
+            for i, axes in enumerate(self.all_axes):
+                if axes in self.axes:
+                    items.append(self._channel_label(i)+'='+str(val[i]))
+            value = '  '.join(items)
+        else:
+            value = 0.0
+            if iaxis in list(range(self.naxes)):
+                value = val
+            value = " Value = "+str(value)
+
+        self.set_status_text( " Xvalue [int] = %d" % (xdata, ), 0)
+        self.set_status_text( " ", 1)
+        self.set_status_text( value, 2)
+
+
+    def set_status_text(self, text, field):
+        """ only touch the status bar if the text actually changes """
+        if self.top.statusbar.GetStatusText(field) != text:
+            self.top.statusbar.SetStatusText(text, field)
+
+
+    def _channel_label(self, i):
+        """ short channel name from the plot title, eg. 'X-GRAD' """
+        if self.plot_titles:
+            return self.plot_titles[i].split('|')[-1].strip()
+        return str(i)
 
     
     def on_scroll(self, button, step, iaxis, key='', ydata=None):
@@ -73,7 +94,10 @@ class PlotPanelGePlotter(PlotPanelStairs):
         pend  = xmax
         if pstr > pend: pstr, pend = pend, pstr
         delt = -1*(pstr - pend)  # keeps delta positive
-        self.top.statusbar.SetStatusText( " Range = %.2f to %.2f  dXvalue = %.2f " % (pstr, pend, delt),3)
+        if reset:
+            self.top.statusbar.SetStatusText( " Range = %.2f to %.2f  dXvalue = %.2f " % (pstr, pend, delt),3)
+        else:
+            self.set_status_text(self._refs_text(iplot), 3)
 
 
     def on_refs_motion(self, xmin, xmax, val, iplot=None):
@@ -85,6 +109,24 @@ class PlotPanelGePlotter(PlotPanelStairs):
         self.top.statusbar.SetStatusText( " Xvalue [int] = " , 0)
         self.top.statusbar.SetStatusText( " Range = %.2f to %.2f" % (pstr, pend),1)
         self.top.statusbar.SetStatusText( " dXvalue = %.2f " % (delt, ), 2)
+        self.set_status_text(self._refs_text(iplot), 3)
+
+
+    def _refs_text(self, iplot):
+        """ area/mean/rms between the reference cursors for the status bar """
+        areas, means, rms = self.calculate_integrals()
+
+        if self.readout_all or self.crosshair:
+            items = []
+            for i, axes in enumerate(self.all_axes):
+                if axes in self.axes:
+                    items.append(self._channel_label(i)+' Area=%1.5g' % (areas[i], ))
+            return ' '+'  '.join(items)
+
+        i = self.refs_axes_index(iplot)
+        if i is None:
+            return ' '
+        return ' %s  Area = %1.5g  Mean = %1.5g  RMS = %1.5g' % (self._channel_label(i), areas[i], means[i], rms[i])
 
 
     def on_middle_select(self, xstr, ystr, xend, yend, iplot):
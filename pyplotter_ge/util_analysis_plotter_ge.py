@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2022 Brian J Soher - All Rights Reserved
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are not permitted without explicit permission.
+
+
+# Python modules
+import sys
+import argparse
+import functools
+import collections
+from multiprocessing import Pool, cpu_count
+
+# 3rd party modules
+import numpy as np
+
+# Our modules
+import pyplotter_ge.util_config_plotter_ge as util_config_pyplotter_ge
+from pyplotter_ge.common.util_stairs import stairs_moments, stairs_slew, stairs_energy
+from pyplotter_ge.util_plotter_ge import NodeCollection, find_node_files, read_node_multiprocess
+
+
+# X-Grad, Y-Grad and Z-Grad are the first three sequencers of every node
+GRADIENT_CHANNELS = (0, 1, 2)
+
+# RHO is the RF amplitude, THETA and OMEGA its phase and frequency. Found
+# by channel name, these are the indices used if a name is missing
+RF_CHANNEL = 4
+RF_GATES = {'theta' : 5,
+            'omega' : 6}
+
+MOMENTS_COLUMNS = ['Node', 'Channel',
+                   'M0 echo', 'M1 echo', 'M2 echo',
+                   'M0 end',  'M1 end',  'M2 end']
+
+LIMITS_COLUMNS = ['Node', 'Channel', 'Limit', 'Time', 'Magnitude']
+
+RF_COLUMNS = ['Node', 'Energy', 'Duty Cycle', 'Peak', 'Window Power']
+
+# one run of segments over a hardware limit, time is where the run starts
+# and magnitude is the worst value in the run
+Violation = collections.namedtuple('Violation', ['node', 'channel', 'kind', 'time', 'magnitude'])
+
+
+
+def node_extent(node):
+    """
+    Returns the (xmin, xmax) of all sequencers in a node, from the stats.
+    Sequencers without data are skipped, (0, 0) if none has any.
+
+    """
+    stats = [seq.stats for seq in node.sequencers if seq.stats is not None]
+    if not stats:
+        return 0, 0
+    xmin = min([item['xmin'] for item in stats])
+    xmax = max([item['xmax'] for item in stats])
+    return xmin, xmax
+
+
+def job_arrays(node, channels, arrays=None):
+    """
+    What a job sends to a worker for the given sequencers of node. That is
+    their (edges, values) from arrays, a list over all sequencers, or from
+    node if arrays is None. If arrays is a file name instead, the worker
+    reads the node itself, see worker_arrays(). That saves pickling, and
+    reading it in on this side, for nodes that are not in memory anyway.
+
+    """
+    if isinstance(arrays, str):
+        return arrays
+    if arrays is None:
+        arrays = [(seq.edges, seq.values) for seq in node.sequencers]
+    return [arrays[i] for i in channels]
+
+
+def worker_arrays(source, channels):
+    """
+    The (edges, values) of each channel from a job_arrays() result, read
+    from the node file if that is what it holds. None if that read fails.
+
+    """
+    if not isinstance(source, str):
+        return source
+    node = read_node_multiprocess(source)
+    if node is None:
+        return None
+    return [(node.sequencers[i].edges, node.sequencers[i].values) for i in channels]
+
+
+def moments_job(node, echo, channels=GRADIENT_CHANNELS, arrays=None):
+    """
+    Returns the argument for moments_multiprocess() for one node. Moments
+    are taken from the start of the node, the echo is given as an offset
+    from that start and the end of TR is the last edge in the node. See
+    job_arrays() for arrays.
+
+    """
+    xmin, xmax = node_extent(node)
+    return job_arrays(node, channels, arrays), channels, xmin, (xmin + echo, xmax)
+
+
+def moments_multiprocess(job):
+    """
+    This has to be outside the main object to be used in a Pool. Returns
+    an array of shape (nchannels, 3, 2) with M0, M1 and M2 of each channel
+    at the echo and at the end of TR, see util_stairs.stairs_moments(). All
+    NaN if the node file could not be read.
+
+    """
+    source, channels, origin, times = job
+    arrays = worker_arrays(source, channels)
+    if arrays is None:
+        return np.full((len(channels), 3, 2), np.nan)
+    return np.array([stairs_moments(e, v, times, origin) for e, v in arrays])
+
+
+def moments_rows(nodes, results, channels=GRADIENT_CHANNELS):
+    """ one table row per node and channel, laid out as MOMENTS_COLUMNS """
+    rows = []
+    for node, moments in zip(nodes, results):
+        for j, i in enumerate(channels):
+            rows.append([node.id, node.sequencers[i].channel] +
+                        moments[j][:,0].tolist() + moments[j][:,1].tolist())
+    return rows
+
+
+def moment_curve(edges, values):
+    """
+    Returns (x, m0), the running zeroth moment of a stairs waveform at each
+    of its edges. M0 is linear inside a segment, so joining these points is
+    the exact curve.
+
+    """
+    edges = np.asarray(edges, dtype=float).ravel()
+    values = np.asarray(values, dtype=float).ravel()
+    m0 = np.concatenate(([0.0], np.cumsum(values*np.diff(edges))))
+    return edges, m0
+
+
+def limit_runs(mask, times, magnitude):
+    """
+    Returns (times, peaks) with the first time and the largest magnitude of
+    each run of consecutive True entries in mask.
+
+    """
+    indx = np.flatnonzero(mask)
+    if len(indx) == 0:
+        return np.array([]), np.array([])
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(indx) != 1) + 1))
+    peaks = np.maximum.reduceat(magnitude[indx], starts)
+    return times[indx[starts]], peaks
+
+
+def limits_job(node, limits, channels=GRADIENT_CHANNELS, arrays=None):
+    """
+    Returns the argument for limits_multiprocess() for one node. The limits
+    dict holds 'amplitude' and 'slew', see Config.get_gradient_limits(). See
+    job_arrays() for arrays.
+
+    """
+    names = [node.sequencers[i].channel for i in channels]
+    return node.id, names, job_arrays(node, channels, arrays), channels, limits['amplitude'], limits['slew']
+
+
+def limits_multiprocess(job):
+    """
+    This has to be outside the main object to be used in a Pool. Returns a
+    list of Violation tuples for one node, amplitude runs first and then
+    slew runs for each channel. If the node file could not be read that is
+    one 'unreadable' Violation.
+
+    """
+    node_id, names, source, channels, amplitude, slew = job
+    arrays = worker_arrays(source, channels)
+    if arrays is None:
+        return [Violation(node_id, '', 'unreadable', np.nan, np.nan)]
+
+    violations = []
+    for channel, (edges, values) in zip(names, arrays):
+        edges = np.asarray(edges).ravel()
+        magnitude = np.abs(np.asarray(values).ravel())
+        for t, peak in zip(*limit_runs(magnitude > amplitude, edges[:-1], magnitude)):
+            violations.append(Violation(node_id, channel, 'amplitude', t.item(), peak.item()))
+
+        times, rate = stairs_slew(edges, values)
+        for t, peak in zip(*limit_runs(rate > slew, times, rate)):
+            violations.append(Violation(node_id, channel, 'slew', t.item(), peak.item()))
+
+    return violations
+
+
+def check_limits(nodes, limits, pool=None, peek=None):
+    """
+    Checks the gradient channels of all nodes against the hardware limits,
+    spread over pool if given. Returns a list of Violation tuples in node
+    order. If given, peek(node) returns the (edges, values) of each
+    sequencer of a node if they are in memory, else None and the node is
+    read from its file in the worker, see WaveformMemory.peek(). Otherwise
+    the nodes must have their arrays.
+
+    """
+    if peek is None:
+        jobs = [limits_job(node, limits) for node in nodes]
+    else:
+        jobs = [limits_job(node, limits, arrays=peek(node) or node.fname) for node in nodes]
+    if pool is not None:
+        results = pool.map(limits_multiprocess, jobs)
+    else:
+        results = [limits_multiprocess(job) for job in jobs]
+    return [item for result in results for item in result]
+
+
+def rf_summary(node, gate='none'):
+    """
+    Returns a dict with the RF 'energy' (sum of RHO**2*width), 'duty' cycle
+    and 'peak' RHO of a node, and its 'extent' in data points. THETA and
+    OMEGA hold phase and frequency, so they can not scale the power, but
+    gate may be 'theta' or 'omega' to only count RHO where that channel is
+    non-zero. A missing or empty RHO or gate channel gives zero energy.
+
+    """
+    xmin, xmax = node_extent(node)
+    extent = xmax - xmin
+    summary = {'energy': 0.0, 'duty': 0.0, 'peak': 0.0, 'extent': extent}
+    irho = node.channels.get('RHO', RF_CHANNEL)
+    if len(node.sequencers) <= irho or node.sequencers[irho].stats is None:
+        return summary
+
+    rho = node.sequencers[irho]
+    arrays = None
+    if gate in RF_GATES:
+        igate = node.channels.get(gate.upper(), RF_GATES[gate])
+        if len(node.sequencers) > igate:
+            seq = node.sequencers[igate]
+            if seq.stats is None:
+                return summary
+            arrays = (seq.edges, seq.values)
+
+    energy, on_time, peak = stairs_energy(rho.edges, rho.values, gate=arrays)
+    summary['energy'] = energy
+    summary['duty'] = on_time/extent if extent > 0 else 0.0
+    summary['peak'] = peak
+    return summary
+
+
+def read_node_rf_multiprocess(fname, gate='none'):
+    """
+    This has to be outside the main object to be used in a Pool. Reads a
+    node and fills in its rf summary while still in the worker, so the RF
+    numbers are ready when loading finishes.
+
+    """
+    node = read_node_multiprocess(fname)
+    if node is not None:
+        node.rf = rf_summary(node, gate)
+    return node
+
+
+def rf_windows(nodes, window):
+    """
+    Returns the RF energy in the sliding window of the given length that
+    ends at each node of a NodeCollection, with the nodes laid end to end
+    as in the timeline view. Cumulative energy at the node boundaries is
+    interpolated, taking the energy as spread evenly over each node, so
+    every window is two lookups into one prefix sum.
+
+    """
+    extent = nodes.column('rf.extent')
+    energy = nodes.column('rf.energy')
+    bounds = np.concatenate(([0.0], np.cumsum(extent)))
+    total = np.concatenate(([0.0], np.cumsum(energy)))
+    starts = np.maximum(bounds[1:] - window, 0.0)
+    return total[1:] - np.interp(starts, bounds, total)
+
+
+def rf_rows(nodes, window_energy, window):
+    """ one table row per node of a NodeCollection, laid out as RF_COLUMNS """
+    columns = [nodes.column('id'),
+               nodes.column('rf.energy'),
+               nodes.column('rf.duty'),
+               nodes.column('rf.peak'),
+               window_energy/window]
+    return [list(row) for row in zip(*[item.tolist() for item in columns])]
+
+
+def read_nodes(path, pool, gate='none'):
+    """ reads all node files under path into a NodeCollection sorted by id """
+    reader = functools.partial(read_node_rf_multiprocess, gate=gate)
+    items = pool.map(reader, find_node_files(path))
+    nodes = NodeCollection([item for item in items if item is not None])    # failed reads return None
+    return nodes.sort('id')
+
+
+
+# ------------------------------------------------------------------------------
+# Headless use, eg.
+#
+#   python -m pyplotter_ge.util_analysis_plotter_ge limits /path/to/plotter/files
+#   python -m pyplotter_ge.util_analysis_plotter_ge rf /path/to/plotter/files
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Checks on a directory of GE Plotter files, without the GUI.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    cmd = commands.add_parser('limits', help='check gradient amplitude and slew against [gradient_limits] in the INI file')
+    cmd.add_argument('path', help='directory with Plotter files')
+    cmd.add_argument('--amplitude', type=float, help='override the amplitude limit')
+    cmd.add_argument('--slew', type=float, help='override the slew limit')
+
+    cmd = commands.add_parser('rf', help='RF energy, duty cycle and peak RHO per node')
+    cmd.add_argument('path', help='directory with Plotter files')
+    cmd.add_argument('--gate', default='none', choices=['none']+sorted(RF_GATES), help='only count RHO where this channel is non-zero')
+    cmd.add_argument('--window', type=float, default=10000000, help='sliding window length in data points')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'rf':
+        if args.window <= 0:
+            parser.error('--window must be greater than 0')
+        with Pool(max(cpu_count()-1, 1)) as pool:
+            nodes = read_nodes(args.path, pool, gate=args.gate)
+        window_energy = rf_windows(nodes, args.window)
+
+        print(','.join(RF_COLUMNS))
+        for row in rf_rows(nodes, window_energy, args.window):
+            print('%d,%g,%g,%g,%g' % tuple(row))
+        print('# %d nodes, total energy %g' % (len(nodes), nodes.column('rf.energy').sum()), file=sys.stderr)
+        return 0
+
+    limits = util_config_pyplotter_ge.Config().get_gradient_limits()
+    if args.amplitude is not None: limits['amplitude'] = args.amplitude
+    if args.slew is not None: limits['slew'] = args.slew
+    if limits['amplitude'] <= 0 or limits['slew'] <= 0:
+        parser.error('gradient limits not set, use --amplitude and --slew or set [gradient_limits] in the INI file')
+
+    with Pool(max(cpu_count()-1, 1)) as pool:
+        nodes = read_nodes(args.path, pool)
+        violations = check_limits(nodes, limits, pool=pool)
+
+    print(','.join(Violation._fields))
+    for item in violations:
+        print('%d,%s,%s,%g,%g' % item)
+    print('# %d nodes, %d violations' % (len(nodes), len(violations)), file=sys.stderr)
+
+    return 1 if violations else 0
+
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -165,3 +165,19 @@ class Config(BaseConfig):
         if 'main_prefs' not in self:
             self['main_prefs'] = {}
         self['main_prefs'][key] = value
+
+
+    def get_gradient_limits(self):
+        """
+        Returns the gradient_limits section as a dict of floats, 'amplitude'
+        and 'slew' are 0 if not set.
+
+        """
+        limits = {'amplitude' : 0.0,
+                  'slew'      : 0.0}
+
+        if 'gradient_limits' in self:
+            for key, val in self['gradient_limits'].items():
+                limits[key] = float(val)
+
+        return limits
@@ -0,0 +1,438 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2022 Brian J Soher - All Rights Reserved
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are not permitted without explicit permission.
+
+
+# Python modules
+import threading
+import collections
+
+# 3rd party modules
+
+# Our modules
+from pyplotter_ge.common.util_stairs import stairs_pack, stairs_unpack, stairs_delta, stairs_undelta
+
+
+
+# states reported by WaveformMemory.state()
+HOT  = 'hot'        # arrays in memory
+COLD = 'cold'       # arrays held compressed, see util_stairs.stairs_pack()
+DELTA = 'delta'     # arrays held as changes against a keyframe node
+FILE = 'file'       # arrays dropped, re-read from the node file when needed
+
+MEMORY_COLUMNS = ['Node', 'State', 'Segments', 'Memory KB', 'Ratio']
+
+
+
+class WaveformMemory(object):
+    """
+    Keeps the parsed edges/values arrays of the loaded nodes within a memory
+    budget of max_bytes. Nodes with arrays in memory are kept in least
+    recently used order. When the total goes over budget, the least
+    recently used nodes are moved to a cold tier where each sequencer is
+    held as compressed bytes, up to cold_bytes. Past that the oldest cold
+    nodes are unloaded down to their metadata, that is ids, titles, stats
+    and the RF summary, which is all that queries and the node list need.
+
+    With keyframes set, every keyframes-th node admitted is a keyframe and
+    the nodes after it that differ from it in only a few segments are kept
+    as those changes instead. They leave the hot and cold tiers for good.
+
+    Anything that needs the arrays of a node calls use(node) first, which
+    marks it most recently used, and expands or decompresses it or re-reads
+    its file if it was not in memory. peek(node) only returns the arrays of
+    nodes already in memory.
+
+    This is called from the GUI and from the prefetch thread, so the
+    bookkeeping is done under a lock. Files are re-read outside of it, and
+    evicted nodes are compressed in a worker thread of their own. Until
+    that is done they keep their arrays and a use() takes them straight
+    back.
+
+    """
+
+    def __init__(self, max_bytes, cold_bytes=0, method='zlib', keyframes=0):
+
+        self.max_bytes = max_bytes
+        self.cold_bytes = cold_bytes
+        self.method = method
+        self.keyframes = keyframes
+        self.nreload = 0
+        self.nthaw = 0
+
+        self._lru = collections.OrderedDict()       # node -> bytes of its arrays
+        self._cold = collections.OrderedDict()      # node -> list of packed sequencers
+        self._deltas = {}                           # node -> (keyframe node, list of sequencer deltas)
+        self._pending = collections.OrderedDict()   # node -> bytes, evicted and waiting to be packed
+        self._nbytes = 0
+        self._ncold = 0
+        self._ndelta = 0
+        self._packed = [0, 0]                       # bytes in and out of stairs_pack() so far
+        self._nadmit = 0
+        self._keyframe = None                       # (node, arrays) of the latest keyframe admitted
+        self._stopped = False
+        self._lock = threading.RLock()
+        self._cond = threading.Condition(self._lock)
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    @property
+    def nloaded(self):
+        return len(self._lru)
+
+    @property
+    def cold_nbytes(self):
+        return self._ncold
+
+    @property
+    def ncold(self):
+        return len(self._cold)
+
+    @property
+    def delta_nbytes(self):
+        return self._ndelta
+
+    @property
+    def ndelta(self):
+        return len(self._deltas)
+
+
+    def state(self, node):
+        """ one of HOT, COLD, DELTA or FILE """
+        with self._lock:
+            if node in self._lru or node in self._pending:
+                return HOT
+            if node in self._cold:
+                return COLD
+            if node in self._deltas:
+                return DELTA if not node.loaded else HOT
+        return HOT if node.loaded else FILE
+
+
+    def cold_size(self, node):
+        """ bytes of the compressed arrays of node, 0 if it is not cold """
+        with self._lock:
+            return sum([len(item) for item in self._cold.get(node, [])])
+
+
+    def delta_size(self, node):
+        """ bytes of the changes stored for node, 0 if it has none """
+        with self._lock:
+            if node not in self._deltas:
+                return 0
+            return _delta_nbytes(self._deltas[node][1])
+
+
+    def reset(self):
+        """ forget all nodes, eg. before loading a new directory """
+        with self._lock:
+            self._lru = collections.OrderedDict()
+            self._cold = collections.OrderedDict()
+            self._deltas = {}
+            self._pending = collections.OrderedDict()
+            self._nbytes = 0
+            self._ncold = 0
+            self._ndelta = 0
+            self._nadmit = 0
+            self._keyframe = None
+            self.nreload = 0
+            self.nthaw = 0
+
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+
+    def set_budget(self, max_bytes, cold_bytes=None):
+        with self._lock:
+            self.max_bytes = max_bytes
+            if cold_bytes is not None:
+                self.cold_bytes = cold_bytes
+            self._evict()
+
+
+    def admit(self, node):
+        """
+        Accounts for a node that was just read, in scan order. Nodes are kept
+        while they fit in the budget, after that they go straight to the cold
+        tier, so the first nodes of a directory stay in memory. These are
+        packed on the calling thread, to keep memory bounded while loading.
+
+        With keyframes set, nodes other than keyframes are first tried as
+        their changes against the latest keyframe, which only needs the two
+        sets of arrays already in hand. Call admit_done() after the last one.
+
+        """
+        arrays = _arrays(node)
+        with self._lock:
+            count = self._nadmit
+            self._nadmit += 1
+            keyframe = self._keyframe
+            if self.keyframes >= 2 and count % self.keyframes == 0:
+                self._keyframe = (node, arrays)
+                keyframe = None
+
+        if keyframe is not None:
+            deltas = _make_deltas(keyframe[1], arrays, self.method)
+            nbytes = _delta_nbytes(deltas)
+            if 2*nbytes < node.waveform_nbytes():
+                with self._lock:
+                    self._deltas[node] = (keyframe[0], deltas)
+                    self._ndelta += nbytes
+                    if node not in self._lru:   # unless a use() took it in meanwhile
+                        node.unload()
+                return
+
+        nbytes = node.waveform_nbytes()
+        with self._lock:
+            if node in self._lru or node in self._pending:
+                return                          # a use() got to it first
+            if self._nbytes + nbytes <= self.max_bytes:
+                self._lru[node] = nbytes
+                self._nbytes += nbytes
+                return
+            fits = self._cold_fits(nbytes)
+
+        packed = self._pack(arrays) if fits else None
+        with self._lock:
+            self._store_cold(node, packed)
+
+
+    def admit_done(self):
+        """ lets go of the arrays of the last keyframe admitted """
+        with self._lock:
+            self._keyframe = None
+
+
+    def peek(self, node):
+        """
+        Returns the list of (edges, values) arrays of each sequencer of node
+        if it is in memory, else None. Unlike use() this does not bring the
+        node in or mark it used, so a look over many nodes leaves the budget
+        and the order of the hot nodes alone.
+
+        """
+        with self._lock:
+            if node in self._lru or node in self._pending:
+                return _arrays(node)
+        return None
+
+
+    def use(self, node):
+        """
+        Returns a list with the (edges, values) arrays of each sequencer of
+        node, brought back into memory if needed, and marks it most recently
+        used. The list is taken under the lock, so it stays good even if the
+        other thread unloads the node right after. Read the arrays from it,
+        not from node.sequencers.
+
+        """
+        while True:
+            with self._lock:
+                if node in self._lru:
+                    self._lru.move_to_end(node)
+                    return _arrays(node)
+                if node in self._pending:
+                    nbytes = self._pending.pop(node)
+                    self._lru[node] = nbytes
+                    self._nbytes += nbytes
+                    self._evict(keep=node)
+                    return _arrays(node)
+                if node in self._cold:
+                    self._thaw(node)
+                delta = self._deltas.get(node) if not node.loaded else None
+
+            if delta is not None:
+                # the keyframe may need reading in too, so not under the lock
+                key, deltas = delta
+                arrays = _apply_deltas(self.use(key), deltas)
+                with self._lock:
+                    if not node.loaded:
+                        _set_arrays(node, arrays)
+            elif not node.loaded:
+                node.reload()
+                self.nreload += 1
+
+            with self._lock:
+                if not node.loaded:
+                    continue                    # unloaded again by the other thread
+                if node in self._pending:
+                    # read in by the other thread too, and evicted since
+                    nbytes = self._pending.pop(node)
+                    self._lru[node] = nbytes
+                    self._nbytes += nbytes
+                elif node not in self._lru:
+                    nbytes = node.waveform_nbytes()
+                    self._lru[node] = nbytes
+                    self._nbytes += nbytes
+                self._lru.move_to_end(node)
+                self._evict(keep=node)
+                return _arrays(node)
+
+
+    # -------------------------------------------------------------------------
+    # Internal methods, call with self._lock held
+
+    def _evict(self, keep=None):
+        while self._nbytes > self.max_bytes and self._lru:
+            node, nbytes = next(iter(self._lru.items()))
+            if node is keep:
+                break
+            del self._lru[node]
+            self._nbytes -= nbytes
+            if node in self._deltas:
+                node.unload()                   # rebuilt from its keyframe
+            elif self._cold_fits(nbytes):
+                self._pending[node] = nbytes
+                self._cond.notify()
+            else:
+                node.unload()
+
+    def _cold_fits(self, nbytes):
+        """ False if nbytes of arrays would not fit the cold tier once packed """
+        if self.cold_bytes <= 0:
+            return False
+        nin, nout = self._packed
+        ratio = float(nout)/nin if nin else 0.0
+        return nbytes*ratio <= self.cold_bytes
+
+    def _pack(self, arrays):
+        """ call without the lock held, packing is the slow part """
+        packed = [stairs_pack(e, v, self.method) for e, v in arrays]
+        nin = sum([e.nbytes + v.nbytes for e, v in arrays])
+        with self._lock:
+            self._packed[0] += nin
+            self._packed[1] += sum([len(item) for item in packed])
+        return packed
+
+    def _store_cold(self, node, packed):
+        """
+        Moves node to the cold tier as packed, or drops its arrays if that is
+        None or too big. Packing is done outside the lock, so a use() may
+        have taken the node back in the meantime, then it is left alone.
+
+        """
+        if node in self._lru or node in self._pending:
+            return
+        node.unload()
+        if node in self._cold:
+            self._ncold -= sum([len(item) for item in self._cold.pop(node)])
+        size = sum([len(item) for item in packed]) if packed is not None else 0
+        if packed is None or size > self.cold_bytes:
+            return
+        self._cold[node] = packed
+        self._ncold += size
+        while self._ncold > self.cold_bytes and self._cold:
+            item, blobs = self._cold.popitem(last=False)
+            self._ncold -= sum([len(blob) for blob in blobs])
+
+    def _thaw(self, node):
+        packed = self._cold.pop(node)
+        self._ncold -= sum([len(item) for item in packed])
+        for seq, blob in zip(node.sequencers, packed):
+            seq.edges, seq.values = stairs_unpack(blob)
+        self.nthaw += 1
+
+    def _run(self):
+        """ worker thread, packs evicted nodes into the cold tier """
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                node, nbytes = next(iter(self._pending.items()))
+                arrays = _arrays(node)
+
+            try:
+                packed = self._pack(arrays)
+            except Exception:
+                packed = None
+
+            with self._cond:
+                # a use() in the meantime took the node back
+                if self._pending.get(node) == nbytes:
+                    del self._pending[node]
+                    self._store_cold(node, packed)
+
+
+
+def _arrays(node):
+    """ the (edges, values) of each sequencer of node """
+    return [(seq.edges, seq.values) for seq in node.sequencers]
+
+
+def _set_arrays(node, arrays):
+    """ edges last, they are what node.loaded looks at """
+    for seq, (e, v) in zip(node.sequencers, arrays):
+        seq.values = v
+    for seq, (e, v) in zip(node.sequencers, arrays):
+        seq.edges = e
+
+
+def _make_deltas(key_arrays, arrays, method):
+    """
+    Changes of each sequencer against the keyframe, see util_stairs.stairs_delta().
+    Sequencers whose segment count differs from the keyframe are packed.
+
+    """
+    deltas = []
+    for (ke, kv), (e, v) in zip(key_arrays, arrays):
+        delta = stairs_delta(ke, kv, e, v)
+        deltas.append(delta if delta is not None else stairs_pack(e, v, method))
+    deltas += [stairs_pack(e, v, method) for e, v in arrays[len(key_arrays):]]
+    return deltas
+
+
+def _apply_deltas(key_arrays, deltas):
+    arrays = []
+    for i, delta in enumerate(deltas):
+        if isinstance(delta, bytes):
+            arrays.append(stairs_unpack(delta))
+        else:
+            arrays.append(stairs_undelta(key_arrays[i][0], key_arrays[i][1], delta))
+    return arrays
+
+
+def _delta_nbytes(deltas):
+    """ bytes held by a list of sequencer deltas, see _make_deltas() """
+    total = 0
+    for delta in deltas:
+        total += len(delta) if isinstance(delta, bytes) else sum([item.nbytes for item in delta])
+    return total
+
+
+
+def memory_rows(memory, nodes):
+    """
+    One table row per node, laid out as MEMORY_COLUMNS. Memory is what the
+    arrays take in the node's current state, ratio is the full size of the
+    arrays over that, so 1 when hot and 0 when only on file.
+
+    """
+    rows = []
+    for node in nodes:
+        state = memory.state(node)
+        nseg = sum([seq.stats['nseg'] for seq in node.sequencers])
+        full = sum([16*seq.stats['nseg'] + 8 for seq in node.sequencers])     # int64 edges and values
+        if state == HOT:
+            nbytes = node.waveform_nbytes()
+        elif state == COLD:
+            nbytes = memory.cold_size(node)
+        elif state == DELTA:
+            nbytes = memory.delta_size(node)
+        else:
+            nbytes = 0
+        rows.append([node.id, state, nseg, nbytes/1024.0, full/float(nbytes) if nbytes else 0.0])
+    return rows
@@ -12,13 +12,34 @@
 # -----------------------------------------------------------------------------
 
 # Python modules
+import os
+import sys
+import time
+import calendar
+import xml.etree.ElementTree as ElementTree
 
 # 3rd party modules
-import wx
 import numpy as np
 
+# need for headless processing, eg. the limits checker - no wx
+try:
+    import wx
+except:
+    wx = None
+
 # Our modules
 import pyplotter_ge.util_config_plotter_ge as util_config_pyplotter_ge
+from pyplotter_ge.common.util_stairs import stairs_stats
+from pyplotter_ge.util_query_plotter_ge import NodeQuery, stats_columns
+
+
+# formats tried, in order, on the PlotterNode 'date' attribute
+DATE_FORMATS = ['%m/%d/%y %H:%M:%S',
+                '%m/%d/%Y %H:%M:%S',
+                '%Y-%m-%d %H:%M:%S',
+                '%Y-%m-%dT%H:%M:%S',
+                '%d-%b-%Y %H:%M:%S',
+                '%a %b %d %H:%M:%S %Y']
 
 
 
@@ -34,6 +55,9 @@ class PrefsGePlotter(object):
         self.zero_line_plot_bottom = False
         self.xaxis_show = False
         self.title_show = False
+        self.readout_all = False
+        self.crosshair = False
+        self.autoy = False
         self.show_gradx = True
         self.show_grady = True
         self.show_gradz = True
@@ -49,6 +73,16 @@ class PrefsGePlotter(object):
         self.line_color_magnitude = "purple"
         self.line_width = 1.0
         self.plot_view = "all"
+        self.prefetch_ahead = 4
+        self.prefetch_memory_mb = 64
+        self.prefetch_bitmaps = False
+        self.async_render = False
+        self.rf_gate = "none"
+        self.rf_window = 10000000
+        self.memory_budget_mb = 1024
+        self.memory_cold_mb = 256
+        self.memory_compress = "zlib"
+        self.memory_keyframes = 0
 
     def set_from_config(self):
 
@@ -64,6 +98,9 @@ class PrefsGePlotter(object):
                 'zero_line_plot_middle',
                 'zero_line_plot_bottom',
                 'xaxis_show',
+                'readout_all',
+                'crosshair',
+                'autoy',
                 'show_gradx',
                 'show_grady',
                 'show_gradz',
@@ -72,6 +109,8 @@ class PrefsGePlotter(object):
                 'show_theta',
                 'show_omega',
                 'data_type_summed',
+                'prefetch_bitmaps',
+                'async_render',
                 ]
 
         for item in attr:
@@ -120,9 +159,34 @@ class PrefsGePlotter(object):
         if tmp: self.line_width = float(tmp)
         tmp = config.get_main_pref('plot_view')
         if tmp: self.plot_view = tmp
+        tmp = config.get_main_pref('prefetch_ahead')
+        if tmp: self.prefetch_ahead = int(tmp)
+        tmp = config.get_main_pref('prefetch_memory_mb')
+        if tmp: self.prefetch_memory_mb = int(tmp)
+        tmp = config.get_main_pref('rf_gate')
+        if tmp: self.rf_gate = tmp
+        tmp = config.get_main_pref('rf_window')
+        if tmp and int(tmp) > 0: self.rf_window = int(tmp)     # window power divides by it
+        tmp = config.get_main_pref('memory_budget_mb')
+        if tmp: self.memory_budget_mb = int(tmp)
+        tmp = config.get_main_pref('memory_cold_mb')
+        if tmp: self.memory_cold_mb = int(tmp)
+        tmp = config.get_main_pref('memory_compress')
+        if tmp: self.memory_compress = tmp
+        tmp = config.get_main_pref('memory_keyframes')
+        if tmp: self.memory_keyframes = int(tmp)
 
 
 class PlotterNode():
+    """
+    One Plotter file. Slotted, as a scan can hold many thousands of these.
+    The sequencers are sorted by id and the channels dict maps each channel
+    name (eg. 'RHO') to its index in sequencers.
+
+    """
+
+    __slots__ = ('id', 'name', 'date', 'author', 'begin_time', 'end_time',
+                 'sequencers', 'channels', 'fname', 'fsize', 'rf')
 
     def __init__(self, attributes=''):
 
@@ -133,7 +197,10 @@ class PlotterNode():
         self.begin_time = ''
         self.end_time = ''
         self.sequencers = []
+        self.channels = {}
         self.fname = ''
+        self.fsize = 0
+        self.rf = None
 
         if attributes:
             self.inflate(attributes)
@@ -146,6 +213,36 @@ class PlotterNode():
     def time_str(self):
         return self.date[9:]
 
+    def sequencer(self, channel):
+        """ returns the sequencer for a channel name, eg. 'RHO' """
+        return self.sequencers[self.channels[channel]]
+
+    @property
+    def loaded(self):
+        """ True if the waveform arrays of all sequencers are in memory """
+        return all([seq.edges is not None for seq in self.sequencers])
+
+    def waveform_nbytes(self):
+        """ bytes held by the edges and values arrays of all sequencers """
+        return sum([seq.edges.nbytes + seq.values.nbytes for seq in self.sequencers if seq.edges is not None])
+
+    def unload(self):
+        """ drops the waveform arrays, ids, titles and stats are kept """
+        for seq in self.sequencers:
+            seq.edges = None
+            seq.values = None
+
+    def reload(self):
+        """ re-reads the waveform arrays from the node file after unload() """
+        with open(self.fname, 'rb') as f:
+            tree = ElementTree.ElementTree(file=f)
+        fresh = PlotterNode(attributes=tree)
+        # edges last, they are what 'loaded' looks at
+        for seq, item in zip(self.sequencers, fresh.sequencers):
+            seq.values = item.values
+        for seq, item in zip(self.sequencers, fresh.sequencers):
+            seq.edges = item.edges
+
     def inflate(self, source):
         root = source.getroot()
         # Quacks like an ElementTree.Element
@@ -162,28 +259,136 @@ class PlotterNode():
         for node in nodes:
             self.sequencers.append(SequencerNode(node))
 
-        # TODO bjs - sort sequencers list by 'id' attribute
+        self.sequencers.sort(key=lambda x: x.id)
+        self.channels = {seq.channel: i for i, seq in enumerate(self.sequencers)}
+
+
+class NodeCollection(object):
+    """
+    The loaded nodes, with parallel numpy columns of their ids, timestamps,
+    file sizes and per-channel statistics, so that sorting, filtering and
+    lookups are vectorized instead of loops over PlotterNode objects. The
+    PlotterNode objects are kept as the handles to the waveform arrays.
+
+    Indexing with an int returns a PlotterNode. Indexing with a slice, an
+    index array or a boolean mask returns a new NodeCollection. Columns are
+    'id', 'time' (seconds since the epoch, NaN if the date is not
+    understood), 'fsize', the '<channel>.<stat>' columns of
+    util_query_plotter_ge.stats_columns() and, when loaded with the RF
+    summary, 'rf.energy', 'rf.duty', 'rf.peak' and 'rf.extent'.
+
+    """
+
+    def __init__(self, nodes=None, columns=None):
+
+        self.nodes = list(nodes) if nodes is not None else []
+        if columns is None:
+            columns = self._build_columns(self.nodes)
+        self.columns = columns
+        self._sorted_ids = None         # (ids, order) for lookup()
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return self.nodes[key]
+        if isinstance(key, slice):
+            return self.take(np.arange(len(self.nodes))[key])
+        key = np.asarray(key)
+        if key.dtype == bool:
+            return self.filter(key)
+        return self.take(key)
+
+    @property
+    def fnames(self):
+        return [node.fname for node in self.nodes]
+
+    def column(self, name):
+        """ returns the named column, raises ValueError if there is none """
+        if name not in self.columns:
+            raise ValueError("Unknown statistic '%s'" % (name, ))
+        return self.columns[name]
+
+    def take(self, indices):
+        """ returns a new collection of the nodes at indices, in that order """
+        indices = np.asarray(indices, dtype=int)
+        nodes = [self.nodes[i] for i in indices]
+        columns = {key: val[indices] for key, val in self.columns.items()}
+        return NodeCollection(nodes, columns)
+
+    def filter(self, mask):
+        """ returns a new collection of the nodes where mask is True """
+        return self.take(np.flatnonzero(mask))
+
+    def sort(self, name='id', reverse=False):
+        """ returns a new collection sorted by the named column """
+        order = np.argsort(self.column(name), kind='stable')
+        if reverse:
+            order = order[::-1]
+        return self.take(order)
+
+    def lookup(self, ids):
+        """ returns the positions of node ids in the collection, -1 where missing """
+        if self._sorted_ids is None:
+            order = np.argsort(self.columns['id'], kind='stable')
+            self._sorted_ids = (self.columns['id'][order], order)
+        sorted_ids, order = self._sorted_ids
+        ids = np.asarray(ids)
+        if len(sorted_ids) == 0:
+            return np.full(ids.shape, -1, dtype=int)
+        k = np.clip(np.searchsorted(sorted_ids, ids), 0, len(sorted_ids)-1)
+        return np.where(sorted_ids[k] == ids, order[k], -1)
+
+    def query(self, text):
+        """ returns the indices of nodes matching text, see util_query_plotter_ge """
+        return NodeQuery(self).run(text)
+
+    def extents(self):
+        """ returns arrays of the xmin and xmax of every node over all channels """
+        starts = [val for key, val in self.columns.items() if key.endswith('.start')]
+        ends = [val for key, val in self.columns.items() if key.endswith('.end')]
+        return np.nanmin(starts, axis=0), np.nanmax(ends, axis=0)
+
+    @staticmethod
+    def _build_columns(nodes):
+        columns = {}
+        columns['id'] = np.array([node.id for node in nodes], dtype=int)
+        columns['time'] = np.array([parse_node_time(node.date) for node in nodes], dtype=float)
+        columns['fsize'] = np.array([node.fsize for node in nodes], dtype=int)
+        columns.update(stats_columns(nodes))
+        if nodes and all([node.rf is not None for node in nodes]):
+            for key in ('energy', 'duty', 'peak', 'extent'):
+                columns['rf.'+key] = np.array([node.rf[key] for node in nodes], dtype=float)
+        return columns
 
 
 class SequencerNode():
+    """
+    One channel of a Plotter file. The raw 'data' text is not kept once it
+    has been parsed into the edges and values arrays, and the channel name
+    is taken from the title once, when the sequencer is read.
+
+    """
+
+    __slots__ = ('id', 'title', 'xtitle', 'ytitle', 'channel', 'edges', 'values', 'stats')
 
     def __init__(self, attributes=''):
         self.id = 0
         self.title = ''
         self.xtitle = ''
         self.ytitle = ''
-        self.data = ''
+        self.channel = ''
         self.edges = None
         self.values = None
+        self.stats = None
 
         if attributes:
             self.inflate(attributes)
 
-    @property
-    def channel(self):
-        items = self.title.split('|')
-        return items[-1].strip()
-
     def inflate(self, source):
 
         # Quacks like an ElementTree.Element
@@ -196,13 +401,14 @@ class SequencerNode():
             val = source.get(item)
             if val:
                 setattr(self, item, val)
+        self.channel = self.title.split('|')[-1].strip()
 
         val = source.findtext('data')
         if val:
-            self.data = val
             edges, values = self.parse_data(val)
             self.edges = np.array(edges)
             self.values = np.array(values)
+            self.stats = stairs_stats(self.edges, self.values)
 
     def parse_data(self, val):
         edges = []
@@ -220,6 +426,34 @@ class SequencerNode():
         return e, v
 
 
+def node_nbytes(node, slotted=True):
+    """
+    Returns the approximate memory held by one PlotterNode, its objects,
+    strings and numpy arrays, in bytes. With slotted False, the same for
+    the node and its sequencers as ordinary instances with a __dict__, so
+    the difference is what the __slots__ save.
+
+    """
+    size = sys.getsizeof if slotted else _unslotted_nbytes
+    total  = size(node) + sys.getsizeof(node.sequencers) + sys.getsizeof(node.channels)
+    total += sum([sys.getsizeof(item) for item in (node.name, node.date, node.author, node.begin_time, node.end_time, node.fname)])
+    for seq in node.sequencers:
+        total += size(seq) + sys.getsizeof(seq.title) + sys.getsizeof(seq.channel)
+        total += sys.getsizeof(seq.xtitle) + sys.getsizeof(seq.ytitle) + sys.getsizeof(seq.stats)
+        if seq.edges is not None:
+            total += seq.edges.nbytes + seq.values.nbytes
+    return total
+
+
+class _Unslotted(object):
+    pass
+
+
+def _unslotted_nbytes(item):
+    """ bytes item would take as an ordinary instance, plus a __dict__ of its attributes """
+    return sys.getsizeof(_Unslotted()) + sys.getsizeof(dict.fromkeys(type(item).__slots__))
+
+
 def is_intable(s):
     """True if the passed value can be turned into a int, False otherwise"""
     try:
@@ -229,6 +463,57 @@ def is_intable(s):
         return False
 
 
+def parse_node_time(date):
+    """ seconds since the epoch of a node 'date' attribute, NaN if not understood """
+    text = date.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return calendar.timegm(time.strptime(text, fmt))
+        except ValueError:
+            pass
+    return np.nan
+
+
+def find_node_files(path):
+    """
+    Returns all Plotter node files in path and its sub-directories, in
+    scan order. Only files ending in ints e.g. 'file.xml.10' are taken, this
+    removes 'ssp' files, and they are sorted on that int.
+
+    """
+    fnames = []
+    for root, _, all_fnames in os.walk(path):
+        for fname in all_fnames:
+            fnames.append(os.path.join(root, fname))
+
+    fnames = [fname for fname in fnames if os.path.isfile(fname)]
+    fnames = [fname for fname in fnames if is_intable(fname.split('.')[-1])]
+    fnames.sort(key=lambda fname: int(fname.split('.')[-1]))
+    return fnames
+
+
+def read_node_multiprocess(fname):
+    """ This has to be outside the main object to be used in a Pool """
+    try:
+        with open(fname, 'rb') as f:
+            tree = ElementTree.ElementTree(file=f)
+
+        if tree:
+            if tree.getroot().tag == 'PulseSequence':
+                node = PlotterNode(attributes=tree)
+                node.id = int(fname.split('.')[-1])
+                node.fname = fname
+                node.fsize = os.path.getsize(fname)
+                return node
+            else:
+                return None
+        else:
+            return None
+
+    except Exception as e:
+        return None
+
+
 def util_create_menu_bar(self, entries, ids=None):
     """
     Example of the menuData function that needs to be in the program
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2022 Brian J Soher - All Rights Reserved
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are not permitted without explicit permission.
+
+
+# Python modules
+import threading
+
+# 3rd party modules
+
+# Our modules
+from pyplotter_ge.common.util_stairs import decimate_stairs
+from pyplotter_ge.common.plot_panel_stairs import render_figure_agg
+
+
+
+class NodePrefetcher(object):
+    """
+    Prepares the nodes around the one currently displayed in a background
+    thread, so that stepping through nodes does not wait on numpy or Agg.
+
+    For each prepared node we keep the list of plot data dicts, with
+    decimated 'edges_draw'/'values_draw' arrays added, and optionally an
+    offscreen Agg render of the whole figure at the current view.
+
+    The prefetch window runs 'ahead' nodes in the direction the user is
+    moving and 'behind' nodes the other way. When the cache grows past
+    max_bytes, the entries furthest from the current node are dropped. The
+    full arrays in the data dicts count toward max_bytes, as do the
+    decimated arrays and bitmaps.
+
+    The make_data argument is a function that returns the list of plot data
+    dicts for a node. It is called from the worker thread.
+
+    """
+
+    def __init__(self, make_data, ahead=4, behind=1, max_bytes=64*1024*1024, bitmaps=False):
+
+        self.make_data = make_data
+        self.ahead     = ahead
+        self.behind    = behind
+        self.max_bytes = max_bytes
+        self.bitmaps   = bitmaps
+
+        self.nodes = []
+        self.npix  = 1000
+        self.template = None
+        self.template_key = None
+
+        self._current   = 0
+        self._direction = 1
+        self._jobs   = []
+        self._cache  = {}
+        self._nbytes = 0
+        self._stopped = False
+        self._cond = threading.Condition()
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+
+    def reset(self, nodes):
+        """ start over on a new list of nodes """
+        with self._cond:
+            self.nodes = nodes
+            self._jobs = []
+            self._cache = {}
+            self._nbytes = 0
+            self._current = 0
+            self._direction = 1
+
+
+    def set_view(self, npix, template=None, key=None):
+        """
+        Sets the decimation width in pixels and, if bitmaps are enabled, the
+        pickled figure and view key used for offscreen renders. Cached items
+        prepared for a different width or view are invalidated.
+
+        """
+        with self._cond:
+            if npix != self.npix:
+                self.npix = npix
+                self._cache = {}
+                self._nbytes = 0
+            if key != self.template_key:
+                self.template = template
+                self.template_key = key
+                for entry in self._cache.values():
+                    if entry['bitmap'] is not None:
+                        self._nbytes -= len(entry['bitmap'][2])
+                        entry['nbytes'] -= len(entry['bitmap'][2])
+                        entry['bitmap'] = None
+                        entry['key'] = None
+
+
+    def get(self, n):
+        """ returns the prepared entry for node index n, or None """
+        with self._cond:
+            return self._cache.get(n)
+
+
+    def notify(self, n):
+        """ tell the prefetcher that node n is now displayed """
+        with self._cond:
+            if n != self._current:
+                self._direction = 1 if n > self._current else -1
+            self._current = n
+            self._jobs = [j for j in self._window()[1:] if self._needs(j)]
+            self._trim()
+            self._cond.notify()
+
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+
+    # -------------------------------------------------------------------------
+    # Internal methods, call with self._cond held
+
+    def _window(self):
+        """ node indices to prepare, current node first, then by priority """
+        n, d = self._current, self._direction
+        items  = [n]
+        items += [n + d*k for k in range(1, self.ahead+1)]
+        items += [n - d*k for k in range(1, self.behind+1)]
+        return [j for j in items if 0 <= j < len(self.nodes)]
+
+    def _needs(self, n):
+        entry = self._cache.get(n)
+        if entry is None:
+            return True
+        if self.bitmaps and self.template is not None:
+            return entry['key'] != self.template_key
+        return False
+
+    def _trim(self):
+        order = sorted(self._cache, key=lambda j: abs(j - self._current), reverse=True)
+        for j in order:
+            if self._nbytes <= self.max_bytes:
+                break
+            self._nbytes -= self._cache.pop(j)['nbytes']
+
+
+    # -------------------------------------------------------------------------
+    # Worker thread
+
+    def _run(self):
+
+        while True:
+            with self._cond:
+                while not self._jobs and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                n = self._jobs.pop(0)
+                nodes = self.nodes
+                npix  = self.npix
+                entry = self._cache.get(n)
+                template, key = None, None
+                if self.bitmaps:
+                    template, key = self.template, self.template_key
+
+            try:
+                entry = self._prepare(nodes[n], npix, template, key, entry)
+            except Exception:
+                # a node we can not prepare is simply drawn the slow way
+                continue
+
+            with self._cond:
+                if nodes is self.nodes and npix == self.npix and key == self.template_key:
+                    old = self._cache.pop(n, None)
+                    if old is not None:
+                        self._nbytes -= old['nbytes']
+                    self._cache[n] = entry
+                    self._nbytes += entry['nbytes']
+                    self._trim()
+
+
+    def _prepare(self, node, npix, template, key, entry):
+
+        if entry is None:
+            data = self.make_data(node)
+            for ddict in data:
+                e, v = decimate_stairs(ddict['edges'], ddict['values'], npix)
+                ddict['edges_draw']  = e
+                ddict['values_draw'] = v
+            entry = {'data': data, 'bitmap': None, 'key': None}
+        else:
+            entry = dict(entry)
+
+        if template is not None and entry['key'] != key:
+            arrays = {i: (item['edges'], item['values']) for i, item in enumerate(entry['data'])}
+            entry['bitmap'] = render_figure_agg(template, arrays)
+            entry['key'] = key
+
+        # the full arrays are counted too, the entry keeps them alive even
+        # after WaveformMemory has let go of the node
+        nbytes = sum([item['edges'].nbytes + item['values'].nbytes +
+                      item['edges_draw'].nbytes + item['values_draw'].nbytes for item in entry['data']])
+        if entry['bitmap'] is not None:
+            nbytes += len(entry['bitmap'][2])
+        entry['nbytes'] = nbytes
+
+        return entry
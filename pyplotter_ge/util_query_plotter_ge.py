@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2022 Brian J Soher - All Rights Reserved
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are not permitted without explicit permission.
+
+
+# Python modules
+import ast
+import operator
+
+# 3rd party modules
+import numpy as np
+
+# Our modules
+
+
+
+# channel names used in queries, in sequencer order
+CHANNEL_ALIASES = ['gradx', 'grady', 'gradz', 'ssp', 'rho', 'theta', 'omega']
+
+# statistic names used in queries and the stairs_stats() key each reads,
+# 'peak' is the larger magnitude of min and max
+STAT_KEYS = {'min'   : 'ymin',
+             'max'   : 'ymax',
+             'start' : 'xmin',
+             'end'   : 'xmax',
+             'nseg'  : 'nseg',
+             'area'  : 'area',
+             'hash'  : 'hash'}
+
+_COMPARE = {ast.Eq    : operator.eq,
+            ast.NotEq : operator.ne,
+            ast.Lt    : operator.lt,
+            ast.LtE   : operator.le,
+            ast.Gt    : operator.gt,
+            ast.GtE   : operator.ge}
+
+_BINARY = {ast.Add  : operator.add,
+           ast.Sub  : operator.sub,
+           ast.Mult : operator.mul,
+           ast.Div  : operator.truediv}
+
+_FUNCTIONS = {'abs' : np.abs}
+
+
+
+def stats_columns(nodes):
+    """
+    Returns a dict of numpy columns with the per-channel statistics of the
+    nodes, from the stats dict each SequencerNode holds since it was read.
+    Columns are named '<channel>.<stat>', eg. 'gradz.max', with channel
+    from CHANNEL_ALIASES and stat from STAT_KEYS or 'peak'. Nodes missing
+    a channel, or with no data in it, read NaN there.
+
+    """
+    columns = {}
+    nchan = max([len(node.sequencers) for node in nodes]) if len(nodes) else 0
+    for i, alias in enumerate(CHANNEL_ALIASES[:nchan]):
+        stats = [node.sequencers[i].stats if i < len(node.sequencers) else None for node in nodes]
+        for stat, key in STAT_KEYS.items():
+            columns[alias+'.'+stat] = np.array([np.nan if item is None else item[key] for item in stats], dtype=float)
+        columns[alias+'.peak'] = np.maximum(np.abs(columns[alias+'.min']),
+                                            np.abs(columns[alias+'.max']))
+    return columns
+
+
+
+class NodeQuery(object):
+    """
+    Evaluates query expressions against a table of node columns, so that a
+    query over thousands of nodes is a few vectorized comparisons. The table
+    is anything with len() and a column(name) method that returns a numpy
+    array or raises ValueError, eg. util_plotter_ge.NodeCollection.
+
+    """
+
+    def __init__(self, table):
+
+        self.table = table
+        self.nnodes = len(table)
+
+    def column(self, name):
+        return self.table.column(name)
+
+    def run(self, text):
+        """
+        Returns the sorted indices of the nodes for which the expression in
+        text is true. Expressions use Python syntax on column names and
+        numbers, eg.
+
+            gradz.peak > 1000 and rho.nseg < 200
+            ssp.hash != ssp.hash[0]
+
+        where a column followed by [n] is its value for node index n. Only
+        comparisons, and/or/not, + - * /, abs() and parentheses are allowed,
+        anything else raises ValueError.
+
+        """
+        try:
+            tree = ast.parse(text.strip(), mode='eval')
+        except SyntaxError as e:
+            raise ValueError('Bad query syntax - %s' % (e.msg, ))
+
+        result = self._eval(tree.body)
+        mask = np.broadcast_to(np.asarray(result, dtype=bool), (self.nnodes, ))
+        return np.flatnonzero(mask)
+
+
+    # -------------------------------------------------------------------------
+    # Internal methods
+
+    def _name(self, node):
+        """ dotted column name of a Name or Attribute node """
+        if isinstance(node, ast.Name):
+            return node.id
+        if isinstance(node, ast.Attribute):
+            return self._name(node.value) + '.' + node.attr
+        raise ValueError('Expected a statistic name, eg. gradz.max')
+
+    def _eval(self, node):
+
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return node.value
+
+        if isinstance(node, (ast.Name, ast.Attribute)):
+            return self.column(self._name(node))
+
+        if isinstance(node, ast.Subscript):
+            col = self.column(self._name(node.value))
+            indx = self._eval(node.slice)
+            if not isinstance(indx, int) or not (0 <= indx < self.nnodes):
+                raise ValueError('Node index must be a number from 0 to %d' % (self.nnodes-1, ))
+            return col[indx]
+
+        if isinstance(node, ast.BoolOp):
+            func = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+            result = self._eval(node.values[0])
+            for item in node.values[1:]:
+                result = func(result, self._eval(item))
+            return result
+
+        if isinstance(node, ast.UnaryOp):
+            if isinstance(node.op, ast.Not):
+                return np.logical_not(self._eval(node.operand))
+            if isinstance(node.op, ast.USub):
+                return -self._eval(node.operand)
+
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+            return _BINARY[type(node.op)](self._eval(node.left), self._eval(node.right))
+
+        if isinstance(node, ast.Compare):
+            result = True
+            left = self._eval(node.left)
+            for op, item in zip(node.ops, node.comparators):
+                if type(op) not in _COMPARE:
+                    raise ValueError('Unsupported comparison in query')
+                right = self._eval(item)
+                result = np.logical_and(result, _COMPARE[type(op)](left, right))
+                left = right
+            return result
+
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _FUNCTIONS:
+            if len(node.args) != 1 or node.keywords:
+                raise ValueError('%s() takes one argument' % (node.func.id, ))
+            return _FUNCTIONS[node.func.id](self._eval(node.args[0]))
+
+        raise ValueError('Unsupported expression in query')
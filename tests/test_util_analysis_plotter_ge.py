@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2022 Brian J Soher - All Rights Reserved
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are not permitted without explicit permission.
+
+
+# Python modules
+import types
+
+# 3rd party modules
+import numpy as np
+
+# Our modules
+from pyplotter_ge.common.util_stairs import stairs_stats
+from pyplotter_ge.util_analysis_plotter_ge import limit_runs, limits_multiprocess, Violation, moments_multiprocess
+from pyplotter_ge.util_analysis_plotter_ge import node_extent, rf_summary, RF_CHANNEL
+
+
+
+def test_limit_runs():
+    mask      = np.array([0, 1, 1, 0, 1, 0, 0, 1, 1, 1], dtype=bool)
+    times     = np.arange(10) * 10.0
+    magnitude = np.array([0, 5, 7, 0, 3, 0, 0, 2, 9, 4])
+    t, peaks = limit_runs(mask, times, magnitude)
+    assert t.tolist() == [10, 40, 70]
+    assert peaks.tolist() == [7, 3, 9]
+
+
+def test_limit_runs_none():
+    t, peaks = limit_runs(np.zeros(5, dtype=bool), np.arange(5), np.arange(5))
+    assert len(t) == 0 and len(peaks) == 0
+
+
+def test_limits_multiprocess():
+    # amplitude runs over 100 at 20-40 (peak 150) and 60-70 (peak 190), steps
+    # of 150 at 20 and 270 at 60 and 70, the falling ramp at 30-50 is gentle
+    edges  = np.array([0, 10, 20, 30, 40, 50, 60, 70, 80])
+    values = np.array([0, 0, 150, 110, 20, -80, 190, -80])
+    job = (7, ['X-Grad'], [(edges, values)], (0, ), 100, 140)
+    result = limits_multiprocess(job)
+    assert result[:2] == [Violation(7, 'X-Grad', 'amplitude', 20, 150),
+                          Violation(7, 'X-Grad', 'amplitude', 60, 190)]
+    assert result[2:] == [Violation(7, 'X-Grad', 'slew', 20, 150),
+                          Violation(7, 'X-Grad', 'slew', 60, 270)]
+
+
+def test_limits_ramp_is_not_a_step():
+    # the same rise of 300 as a ramp of 10 sample treads and as one step
+    ramp = np.array([0, 100, 200, 300, 300])
+    edges = np.array([0, 100, 110, 120, 130, 200])
+    step = np.array([0, 300, 300, 300, 300])
+    assert limits_multiprocess((1, ['Y-Grad'], [(edges, ramp)], (1, ), 400, 50)) == []
+    assert limits_multiprocess((1, ['Y-Grad'], [(edges, step)], (1, ), 400, 50)) == [Violation(1, 'Y-Grad', 'slew', 100, 300)]
+
+
+def test_workers_report_unreadable_files(tmp_path):
+    fname = str(tmp_path / 'missing.1')
+    result = limits_multiprocess((1, ['X-Grad'], fname, (0, ), 400, 50))
+    assert [item[:3] for item in result] == [(1, '', 'unreadable')]
+    moments = moments_multiprocess((fname, (0, 1, 2), 0.0, (10.0, 20.0)))
+    assert moments.shape == (3, 3, 2) and np.isnan(moments).all()
+
+
+def _sequencer(edges=None, values=None):
+    """ a stand-in SequencerNode, with no data if edges is None """
+    seq = types.SimpleNamespace(edges=None, values=None, stats=None)
+    if edges is not None:
+        seq.edges, seq.values = np.array(edges), np.array(values)
+        seq.stats = stairs_stats(seq.edges, seq.values)
+    return seq
+
+
+def test_rf_summary_skips_empty_sequencers():
+    sequencers = [_sequencer() for i in range(7)]
+    sequencers[0] = _sequencer([10, 20, 90], [1, 0])
+    node = types.SimpleNamespace(sequencers=sequencers, channels={})
+    assert node_extent(node) == (10, 90)
+    assert rf_summary(node) == {'energy': 0.0, 'duty': 0.0, 'peak': 0.0, 'extent': 80}
+
+    sequencers[RF_CHANNEL] = _sequencer([10, 30, 50], [2, 0])
+    assert rf_summary(node)['energy'] == 80
+    assert rf_summary(node, gate='theta')['energy'] == 0.0
+    assert node_extent(types.SimpleNamespace(sequencers=[_sequencer()])) == (0, 0)
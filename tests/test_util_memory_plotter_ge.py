@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2022 Brian J Soher - All Rights Reserved
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are not permitted without explicit permission.
+
+
+# Python modules
+import time
+import types
+import threading
+
+# 3rd party modules
+import numpy as np
+
+# Our modules
+from pyplotter_ge.util_memory_plotter_ge import WaveformMemory
+
+
+
+class _Node(object):
+    """ a stand-in PlotterNode, reload() brings back the arrays it was made with """
+
+    def __init__(self, seed):
+        rng = np.random.default_rng(seed)
+        self._arrays = []
+        for i in range(3):
+            nseg = int(rng.integers(200, 400))
+            edges = np.cumsum(rng.integers(1, 20, nseg+1))
+            self._arrays.append((edges, rng.integers(-50, 50, nseg)))
+        self.sequencers = [types.SimpleNamespace(edges=e, values=v) for e, v in self._arrays]
+
+    @property
+    def loaded(self):
+        return all([seq.edges is not None for seq in self.sequencers])
+
+    def waveform_nbytes(self):
+        return sum([seq.edges.nbytes + seq.values.nbytes for seq in self.sequencers if seq.edges is not None])
+
+    def unload(self):
+        for seq in self.sequencers:
+            seq.edges = None
+            seq.values = None
+
+    def reload(self):
+        time.sleep(0.0005)
+        for seq, (e, v) in zip(self.sequencers, self._arrays):
+            seq.values = v.copy()
+        for seq, (e, v) in zip(self.sequencers, self._arrays):
+            seq.edges = e.copy()
+
+
+def _check_tiers(memory):
+    """ the cold byte count matches the blobs held and no node is in two tiers """
+    with memory._lock:
+        assert memory._ncold == sum([sum([len(blob) for blob in blobs]) for blobs in memory._cold.values()])
+        assert memory._ncold <= memory.cold_bytes
+        assert not set(memory._lru) & set(memory._cold)
+        assert not set(memory._pending) & set(memory._cold)
+        assert memory._nbytes == sum(memory._lru.values())
+
+
+def test_cold_tier_accounting_threaded():
+    # nodes are admitted while other threads use the ones already in
+    nodes = [_Node(seed) for seed in range(24)]
+    memory = WaveformMemory(3*nodes[0].waveform_nbytes(), cold_bytes=50000)
+    admitted = [0]
+
+    errors = []
+    def run(seed):
+        rng = np.random.default_rng(seed)
+        try:
+            for k in range(1500):
+                i = int(rng.integers(admitted[0]+1)) if k % 2 else admitted[0]
+                i = min(i, len(nodes)-1)
+                arrays = memory.use(nodes[i])
+                for (e, v), (re, rv) in zip(arrays, nodes[i]._arrays):
+                    assert np.array_equal(e, re) and np.array_equal(v, rv)
+                if k % 50 == 0:
+                    _check_tiers(memory)
+        except AssertionError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(seed, )) for seed in range(3)]
+    for thread in threads:
+        thread.start()
+    for i, node in enumerate(nodes):
+        admitted[0] = i
+        memory.admit(node)
+        time.sleep(0.002)
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+
+    for k in range(500):
+        with memory._lock:
+            if not memory._pending:
+                break
+        time.sleep(0.01)
+    _check_tiers(memory)
+    assert memory.ncold > 0
+    for node in nodes:
+        memory.use(node)
+    memory.stop()
+    _check_tiers(memory)
+    assert memory.nthaw > 0
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2022 Brian J Soher - All Rights Reserved
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are not permitted without explicit permission.
+
+
+# Python modules
+import types
+
+# 3rd party modules
+import numpy as np
+
+# Our modules
+from pyplotter_ge.common.util_stairs import stairs_stats
+from pyplotter_ge.util_query_plotter_ge import stats_columns, NodeQuery
+
+
+
+def _node(*channels):
+    """ a stand-in node, one (edges, values) or None per sequencer """
+    sequencers = []
+    for item in channels:
+        stats = None if item is None else stairs_stats(np.array(item[0]), np.array(item[1]))
+        sequencers.append(types.SimpleNamespace(stats=stats))
+    return types.SimpleNamespace(sequencers=sequencers)
+
+
+class _Table(object):
+    """ a stand-in NodeCollection over a dict of columns """
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __len__(self):
+        return len(next(iter(self.columns.values())))
+
+    def column(self, name):
+        return self.columns[name]
+
+
+def test_stats_columns_missing_channels():
+    nodes = [_node(([0, 10], [5]), ([0, 10], [1])),
+             _node(([0, 20], [-7]), None),
+             _node(([0, 30], [2]))]
+    columns = stats_columns(nodes)
+    assert columns['gradx.peak'].tolist() == [5, 7, 2]
+    assert columns['grady.max'][0] == 1
+    assert np.isnan(columns['grady.max'][1:]).all()
+
+    query = NodeQuery(_Table(columns))
+    assert query.run('grady.max > 0').tolist() == [0]
+    assert query.run('gradx.end >= 20').tolist() == [1, 2]
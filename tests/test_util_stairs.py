@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2022 Brian J Soher - All Rights Reserved
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are not permitted without explicit permission.
+
+
+# Python modules
+
+# 3rd party modules
+import numpy as np
+import pytest
+
+# Our modules
+from pyplotter_ge.common.util_stairs import stairs_pack, stairs_unpack, stairs_delta, stairs_undelta, PACK_METHODS
+from pyplotter_ge.common.util_stairs import stairs_difference, stairs_stats, StairsTimeline
+
+
+
+def _stairs(nseg, seed=0):
+    """ a gradient-like int64 stairs waveform, repeated widths and values """
+    rng = np.random.default_rng(seed)
+    edges = np.cumsum(np.concatenate(([1000], rng.choice([4, 10, 40], nseg))))
+    values = np.repeat(rng.integers(-32768, 32767, nseg//10 + 1), 10)[:nseg]
+    return edges.astype(np.int64), values.astype(np.int64)
+
+
+def _assert_same(a, b):
+    assert a.dtype == b.dtype
+    assert np.array_equal(a, b)
+
+
+@pytest.mark.parametrize('method', sorted(PACK_METHODS))
+def test_pack_round_trip(method):
+    edges, values = _stairs(5000)
+    blob = stairs_pack(edges, values, method)
+    e, v = stairs_unpack(blob)
+    _assert_same(e, edges)
+    _assert_same(v, values)
+    assert len(blob) < (edges.nbytes + values.nbytes)//10
+
+
+@pytest.mark.parametrize('edges, values', [
+    (np.array([0], dtype=np.int64),          np.array([], dtype=np.int64)),
+    (np.array([5, 6], dtype=np.int64),       np.array([-7], dtype=np.int64)),
+    (np.array([0, 3, 9], dtype=np.int32),    np.array([1, 1], dtype=np.int16)),
+    (np.array([0.0, 0.5, 2.25]),             np.array([0.1, -3.0])),
+    (np.array([-2**40, 0, 2**40]),           np.array([2**62, -2**62])),
+])
+def test_pack_round_trip_edge_cases(edges, values):
+    e, v = stairs_unpack(stairs_pack(edges, values))
+    _assert_same(e, edges)
+    _assert_same(v, values)
+
+
+def test_unpacked_arrays_are_writeable():
+    edges, values = _stairs(100)
+    e, v = stairs_unpack(stairs_pack(edges, values))
+    e[0] = 1
+    v[0] = 1
+
+
+def test_delta_round_trip():
+    ref_edges, ref_values = _stairs(2000)
+    edges, values = ref_edges.copy(), ref_values.copy()
+    values[[3, 500, 1999]] = [1, 2, 3]
+    edges[100] += 1
+
+    delta = stairs_delta(ref_edges, ref_values, edges, values)
+    assert len(delta[0]) == 1 and len(delta[2]) == 3
+
+    e, v = stairs_undelta(ref_edges, ref_values, delta)
+    _assert_same(e, edges)
+    _assert_same(v, values)
+
+
+def test_delta_leaves_reference_alone():
+    ref_edges, ref_values = _stairs(50)
+    values = ref_values + 1
+    keep = ref_values.copy()
+    stairs_undelta(ref_edges, ref_values, stairs_delta(ref_edges, ref_values, ref_edges, values))
+    _assert_same(ref_values, keep)
+
+
+def test_delta_of_identical_is_empty():
+    edges, values = _stairs(50)
+    delta = stairs_delta(edges, values, edges, values)
+    assert all(len(item) == 0 for item in delta)
+
+
+def test_delta_needs_same_segment_count():
+    edges, values = _stairs(50)
+    assert stairs_delta(edges, values, edges[:-1], values[:-1]) is None
+
+
+def _dense(edges, values, x):
+    """ value of a stairs waveform at each x, 0 outside its extent """
+    indx = np.searchsorted(edges, x, side='right') - 1
+    inside = (indx >= 0) & (indx < len(values))
+    return np.where(inside, np.asarray(values)[np.clip(indx, 0, len(values)-1)], 0)
+
+
+def test_difference_mismatched_edges():
+    e, v = stairs_difference([0, 10, 20], [5, 7], [5, 15, 30], [1, 2])
+    assert e.tolist() == [0, 5, 10, 15, 20, 30]
+    assert v.tolist() == [5, 4, 6, 5, -2]
+
+
+def test_difference_merges_equal_neighbours():
+    e, v = stairs_difference([0, 10, 20], [5, 5], [0, 5, 20], [1, 1])
+    assert e.tolist() == [0, 20]
+    assert v.tolist() == [4]
+
+
+def test_difference_mismatched_edges_random():
+    rng = np.random.default_rng(3)
+    for k in range(20):
+        e1 = np.cumsum(rng.integers(1, 5, 30))
+        e2 = np.cumsum(rng.integers(1, 5, 25)) + rng.integers(-10, 10)
+        v1 = rng.integers(-3, 3, 29)
+        v2 = rng.integers(-3, 3, 24)
+        e, v = stairs_difference(e1, v1, e2, v2)
+        x = np.arange(min(e1[0], e2[0]), max(e1[-1], e2[-1])) + 0.5
+        assert np.array_equal(_dense(e, v, x), _dense(e1, v1, x) - _dense(e2, v2, x))
+
+
+def test_timeline_area_matches_parts():
+    rng = np.random.default_rng(5)
+    parts, shifts, x = [], [], 0
+    for k in range(30):
+        e = np.cumsum(rng.integers(1, 6, rng.integers(2, 12))).astype(np.int64)
+        v = rng.integers(-50, 50, len(e)-1).astype(np.int64)
+        x += rng.integers(0, 4)
+        parts.append((e, v))
+        shifts.append(x - e[0])
+        x += e[-1] - e[0]
+    fetched = []
+    def fetch(k):
+        fetched.append(k)
+        return parts[k]
+    timeline = StairsTimeline([stairs_stats(e, v) for e, v in parts], shifts, fetch, cache_parts=2)
+
+    cells = np.arange(-5, x+5) + 0.5
+    dense = sum([_dense(e+d, v, cells) for (e, v), d in zip(parts, shifts)])
+    for k in range(100):
+        x0, x1 = np.sort(rng.integers(-5, x+5, 2))
+        if x0 == x1:
+            continue
+        del fetched[:]
+        inside = dense[(cells > x0) & (cells < x1)]
+        area, mean, rms = timeline.area(x0, x1)
+        assert area == pytest.approx(inside.sum())
+        assert rms == pytest.approx(np.sqrt(np.mean(inside.astype(float)**2)))
+        assert len(fetched) <= 2
+    assert len(timeline._integrals) <= 2